@@ -0,0 +1,92 @@
+"""
+Aho-Corasick multi-pattern matcher used by the fuzzy corpus search.
+The automaton is built once over all target domains, then each file name is
+scanned a single time and reports every domain it contains as a substring,
+so fuzzy matching costs O(file name length) per file instead of O(sites).
+"""
+
+from collections import deque
+
+
+def buildAutomaton(patterns):
+    """
+    Compiles a list of patterns into an Aho-Corasick automaton.
+
+    Parameters:
+    - patterns (iterable): Strings to search for. Duplicates are matched once.
+
+    Returns:
+    - dict: The automaton with keys
+        - "goto" (list of dict): Trie transitions for each state.
+        - "fail" (list of int): Failure link for each state.
+        - "output" (list of tuple): Patterns that end at each state, including
+          those reached through failure links.
+    """
+    goto = [{}]
+    output = [[]]
+
+    # Build the trie
+    for pattern in dict.fromkeys(patterns):
+        state = 0
+        for char in pattern:
+            nextState = goto[state].get(char)
+            if nextState is None:
+                nextState = len(goto)
+                goto[state][char] = nextState
+                goto.append({})
+                output.append([])
+            state = nextState
+        output[state].append(pattern)
+
+    # Breadth first pass to set the failure links and merge outputs
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, nextState in goto[state].items():
+            queue.append(nextState)
+
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[nextState] = goto[fallback].get(char, 0)
+
+            # The root's (empty) pattern is reported separately in findPatterns
+            if fail[nextState]:
+                output[nextState].extend(output[fail[nextState]])
+
+    return {
+        "goto": goto,
+        "fail": fail,
+        "output": [tuple(patternsHere) for patternsHere in output],
+    }
+
+
+def findPatterns(automaton, text):
+    """
+    Scans text once and returns every pattern it contains.
+
+    Parameters:
+    - automaton (dict): Automaton from buildAutomaton.
+    - text (str): The string to scan e.g., a file name.
+
+    Returns:
+    - list: The patterns found in text, each reported once, in order of first occurrence.
+    """
+    goto = automaton["goto"]
+    fail = automaton["fail"]
+    output = automaton["output"]
+
+    # An empty pattern is contained in every string
+    found = dict.fromkeys(output[0])
+    state = 0
+
+    for char in text:
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+
+        if output[state]:
+            found.update(dict.fromkeys(output[state]))
+
+    return list(found)
@@ -7,10 +7,11 @@ J. Chanenson
 """
 
 import os, csv
-import tldextract
 from tqdm import tqdm
 
-def findExactMatchInDir(path, website):
+import corpusCatalog, corpusLookup, domainParser, lookupDaemon
+
+def findExactMatchInDir(path, website, catalog=None, shard=False, workers=None):
     """
     Searches for files in a directory (and its subdirectories) 
     that exactly match the provided domain, prioritizing .com domains.
@@ -18,13 +19,24 @@ def findExactMatchInDir(path, website):
     Parameters:
     - path (str): The current directory path.
     - website (str): The website URL or name to use for matching.
+    - catalog (sqlite3.Connection): Optional corpus catalog to query instead of walking path.
+    - shard (bool): Only list the website's letter-shard directories (path must be the corpus root).
+    - workers (int): List the tree on this many threads (see corpusLookup.walkCorpus).
 
     Returns:
     - str or None: Returns the file path if a match is found, or None otherwise.
     """
+    if catalog is not None:
+        return corpusCatalog.catalogExactMatchTLD(catalog, website, bareCom=False)
+    if shard:
+        return corpusLookup.findExactMatchInShard(path, website, bareCom=False)
+    if workers:
+        batchResults = corpusLookup.findExactMatchesInDir(path, [website], bareCom=False, workers=workers)
+        return batchResults[corpusLookup.websiteDomain(website)]
+
     # Take in website URL or name
     if "." in website:
-        domain = tldextract.extract(website).domain
+        domain = domainParser.extract(website).domain
     else:
         domain = website
 
@@ -32,7 +44,7 @@ def findExactMatchInDir(path, website):
     foundComPath = None  # Store path if .com TLD is found
     foundOtherPath = None  # Store path if any other TLD is found
 
-    for entry in os.scandir(path):
+    for entry in corpusLookup.listDir(path):
         if entry.is_dir():
             # Recurse into the directory
             foundPath = findExactMatchInDir(entry.path, website)
@@ -41,7 +53,7 @@ def findExactMatchInDir(path, website):
             if foundPath:
                  # Extract the filename and TLD
                 fName = os.path.splitext(os.path.basename(foundPath))[0]
-                _, _, ext = tldextract.extract(fName)
+                _, _, ext = domainParser.extract(fName)
                 
                 # Check if the TLD is "com"
                 if ext == "com":
@@ -54,7 +66,7 @@ def findExactMatchInDir(path, website):
         else:
             # # Extract the filename and URL parts
             baseName, _ = os.path.splitext(entry.name)
-            extractedResult = tldextract.extract(baseName)  # Extract domain and TLD
+            extractedResult = domainParser.extract(baseName)  # Extract domain and TLD
             
             # Check if the extracted domain matches our target domain
             if extractedResult.domain == domain:
@@ -80,7 +92,7 @@ def writeCSV(data, filename):
         writer = csv.writer(file)
         writer.writerows(data)
 
-def processCSV(inputFile, outputFile, directoryPath):
+def processCSV(inputFile, outputFile, directoryPath, catalog=None, shard=False, workers=None):
     data = readCSV(inputFile)
     newData = []
     headers = data[0]  # Assuming the first row is headers
@@ -90,6 +102,19 @@ def processCSV(inputFile, outputFile, directoryPath):
         newHeaders.append(header + " Exists")
     newData.append(newHeaders)
 
+    # No index to query, so resolve every cell up front: through the lookup daemon
+    # if it is serving this corpus, otherwise in one pass over the corpus
+    batchResults = None
+    if catalog is None and not shard:
+        items = [item for row in data[1:] for item in row if item]
+        daemonPaths = None
+        if lookupDaemon.daemonServes(directoryPath):
+            daemonPaths = lookupDaemon.daemonLookup(items, bareCom=False)
+        if daemonPaths is not None:
+            batchResults = {corpusLookup.websiteDomain(item): path for item, path in zip(items, daemonPaths)}
+        else:
+            batchResults = corpusLookup.findExactMatchesInDir(directoryPath, items, bareCom=False, workers=workers)
+
     # Check existence and append results
     for row in tqdm(data[1:]):  # skipping the header row
         newRow = []
@@ -98,7 +123,10 @@ def processCSV(inputFile, outputFile, directoryPath):
             newRow.append(item)
             if item:  # Check if the cell (item) is not empty
                 
-                result = findExactMatchInDir(directoryPath, item)  # Returns file path or None
+                if batchResults is not None:
+                    result = batchResults[corpusLookup.websiteDomain(item)]
+                else:
+                    result = findExactMatchInDir(directoryPath, item, catalog=catalog, shard=shard)  # Returns file path or None
                 if result:
                     # print(result)
                     newRow.append(result)  # Add the file path to the new row
@@ -117,5 +145,6 @@ if __name__ == '__main__':
     # Execute the function
     directory = "../privacy-policy-historical-master"
     output = "process_application_data\Corpus_Subset_Selection_Checked.csv"
-    processCSV('process_application_data\Corpus_Subset_Selection.csv', output, directory)
+    catalog = corpusCatalog.loadCatalog(directory)
+    processCSV('process_application_data\Corpus_Subset_Selection.csv', output, directory, catalog=catalog)
     print(f"Wrote out checked CSV file to {output}")
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+Compact output for convert_corpus. Every chunk is stored once in a chunk table
+(docId, chunkIndex, text, tokenCount) along with the list of CI parameters,
+instead of as nine full "Annotate:... Param--->" rows in a CSV per document.
+The table is JSONL (one JSON object per line, after a first line holding the
+parameters) or Parquet (parameters in the file's metadata), optionally
+compressed with zstd. expandPrompts turns a table back into the exact prompts
+the CSVs hold, lazily.
+"""
+
+import io, json, os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Chunks buffered before a Parquet row group is written
+PARQUET_ROW_GROUP = 10_000
+
+_schema = pa.schema([
+    ("docId", pa.string()),
+    ("chunkIndex", pa.int32()),
+    ("text", pa.string()),
+    ("tokenCount", pa.int32()),
+])
+
+
+def chunkTablePath(outputDir, tableFormat="jsonl", compression=None):
+    """
+    Location of the chunk table for a run.
+
+    Parameters:
+    - outputDir (str): Directory of the run (see convert_corpus.createNewSubdir).
+    - tableFormat (str): "jsonl" or "parquet".
+    - compression (str): None or "zstd".
+
+    Returns:
+    - str: chunks.jsonl, chunks.jsonl.zst or chunks.parquet in outputDir.
+    """
+    if tableFormat == "parquet":
+        return os.path.join(outputDir, "chunks.parquet")
+    if tableFormat == "jsonl":
+        # The extension is how the JSONL reader knows to decompress
+        return os.path.join(outputDir, "chunks.jsonl" + (".zst" if compression == "zstd" else ""))
+    raise ValueError(f"Unknown chunk table format: {tableFormat}")
+
+
+def openChunkTable(outputDir, params, tableFormat="jsonl", compression=None):
+    """
+    Creates a chunk table, replacing any from an earlier run in the same directory.
+
+    Parameters:
+    - outputDir (str): Directory of the run.
+    - params (list): The CI parameters every chunk is annotated with.
+    - tableFormat (str): "jsonl" or "parquet".
+    - compression (str): None or "zstd".
+
+    Returns:
+    - dict: The table, write to it with writeDocument and finish with closeChunkTable.
+    """
+    if compression not in (None, "zstd"):
+        raise ValueError(f"Unsupported compression: {compression}")
+
+    path = chunkTablePath(outputDir, tableFormat, compression)
+    table = {"format": tableFormat, "path": path, "params": list(params), "numChunks": 0}
+
+    if tableFormat == "jsonl":
+        table["file"] = pa.output_stream(path)
+        table["file"].write((json.dumps({"params": table["params"]}) + "\n").encode('utf-8'))
+    else:
+        schema = _schema.with_metadata({"params": json.dumps(table["params"])})
+        table["writer"] = pq.ParquetWriter(path, schema, compression=compression or "none")
+        table["rows"] = {name: [] for name in _schema.names}
+
+    return table
+
+
+def writeDocument(table, docId, chunks):
+    """
+    Adds the chunks of one document.
+
+    Parameters:
+    - table (dict): Table from openChunkTable.
+    - docId (str): Name of the document (what its CSV would be called, see convert_corpus.documentId).
+    - chunks (Iterable[Chunk]): The unannotated chunks, in order, with their token counts.
+
+    Returns:
+    - int: Number of chunks written.
+    """
+    numChunks = 0
+    for chunkIndex, chunk in enumerate(chunks):
+        numChunks += 1
+        if table["format"] == "jsonl":
+            row = {"docId": docId, "chunkIndex": chunkIndex, "text": chunk.text, "tokenCount": chunk.tokenCount}
+            table["file"].write((json.dumps(row, ensure_ascii=False) + "\n").encode('utf-8'))
+        else:
+            rows = table["rows"]
+            rows["docId"].append(docId)
+            rows["chunkIndex"].append(chunkIndex)
+            rows["text"].append(chunk.text)
+            rows["tokenCount"].append(chunk.tokenCount)
+            if len(rows["docId"]) >= PARQUET_ROW_GROUP:
+                _flushRows(table)
+
+    table["numChunks"] += numChunks
+    return numChunks
+
+
+def _flushRows(table):
+    """
+    Writes the buffered Parquet rows as a row group.
+    """
+    rows = table["rows"]
+    if rows["docId"]:
+        table["writer"].write_table(pa.table(rows, schema=_schema))
+        table["rows"] = {name: [] for name in _schema.names}
+
+
+def closeChunkTable(table):
+    """
+    Flushes and closes the table.
+    """
+    if table["format"] == "jsonl":
+        table["file"].close()
+    else:
+        _flushRows(table)
+        table["writer"].close()
+
+
+def readParams(path):
+    """
+    The CI parameters recorded in a chunk table.
+
+    Parameters:
+    - path (str): A chunks.jsonl, chunks.jsonl.zst or chunks.parquet file.
+
+    Returns:
+    - list: The parameters, in annotation order.
+    """
+    if path.endswith(".parquet"):
+        return json.loads(pq.ParquetFile(path).schema_arrow.metadata[b"params"])
+
+    with io.TextIOWrapper(pa.input_stream(path), encoding='utf-8') as file:
+        return json.loads(file.readline())["params"]
+
+
+def iterChunks(path, batchSize=1000):
+    """
+    Reads a chunk table one row at a time.
+
+    Parameters:
+    - path (str): A chunks.jsonl, chunks.jsonl.zst or chunks.parquet file.
+    - batchSize (int): Parquet rows decoded at once.
+
+    Yields:
+    - dict: A chunk, with keys "docId", "chunkIndex", "text" and "tokenCount".
+    """
+    if path.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batchSize):
+            yield from batch.to_pylist()
+        return
+
+    with io.TextIOWrapper(pa.input_stream(path), encoding='utf-8') as file:
+        file.readline()  # The parameters
+        for line in file:
+            yield json.loads(line)
+
+
+def expandPrompts(path, docIds=None):
+    """
+    Lazily expands a chunk table into the annotated prompts, in the same order
+    and with the same text as the rows of the per-document CSVs.
+
+    Parameters:
+    - path (str): A chunks.jsonl, chunks.jsonl.zst or chunks.parquet file.
+    - docIds (set): Only expand these documents, None for all of them.
+
+    Yields:
+    - tuple: (docId, prompt)
+    """
+    params = readParams(path)
+    for row in iterChunks(path):
+        if docIds is None or row["docId"] in docIds:
+            for param in params:
+                # Same format as convert_corpus.addAnnotations
+                yield row["docId"], "Annotate:" + row["text"] + " " + param + "--->"
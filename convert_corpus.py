@@ -6,10 +6,11 @@ This is then saved to a CSV
 J. Chanenson
 8/8/23
 """
-import csv, os, tiktoken, re
-from nltk.tokenize import sent_tokenize, word_tokenize 
+import csv, os, tiktoken
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
-import gatherPopularSites
+import chunkTable, corpusMetadata, gatherPopularSites, sentenceSplit, textCache
 
 # Uncomment below if you need to download punkt
 # import nltk
@@ -19,6 +20,25 @@ import gatherPopularSites
 print("Loading in Tokenizer from tiktoken...")
 encoding = tiktoken.get_encoding("cl100k_base")
 
+# Sentence segmenter: "punkt" (same sentences as nltk's sent_tokenize, model loaded once)
+# or "rules" (faster rule-based splitter for privacy policies), see sentenceSplit.py
+SEGMENTER = "punkt"
+
+# Set to a number of processes to convert the documents on a process pool (e.g., for a
+# Tranco top-10k selection); None converts them one at a time in this process
+PROCESS_WORKERS = None
+
+# "csv" writes every annotated prompt to a CSV per document. "jsonl" or "parquet" write
+# each chunk once to a single chunk table instead (see chunkTable.py), about a ninth of the size
+OUTPUT_FORMAT = "csv"
+
+# Set to "zstd" to compress the chunk table
+OUTPUT_COMPRESSION = None
+
+# The CI-GKC parameters each chunk is annotated with
+PARAMS = ['Sender', 'Subject', 'Consequence', 'Modality', 'Recipient', 
+          'Transmission-Principle', 'Condition', 'Aim', 'Attribute']
+
 def countTokens(text):
     """
     Count the number of tokens using tiktoken's encoder.
@@ -31,37 +51,252 @@ def countTokens(text):
     """
     return len(encoding.encode(text))  
 
-def main():
+# A chunk of text with its exact token count, so nothing downstream has to encode it again
+Chunk = namedtuple("Chunk", ["text", "tokenCount"])
+
+def main(processWorkers=PROCESS_WORKERS, outputFormat=OUTPUT_FORMAT, compression=OUTPUT_COMPRESSION):
     # Get list of files in corpus 
     fileList = dataInput()
 
     newSubdir = createNewSubdir()
 
-    for inputPath in fileList:
-        fileContent = readFile(inputPath)
-        
-        # Strip out md and the block quote at begining
-        plainText = stripMarkdown(fileContent)
+    # One chunk table for the whole run instead of a CSV per document
+    table = None
+    if outputFormat != "csv":
+        table = chunkTable.openChunkTable(newSubdir, PARAMS, outputFormat, compression)
 
-        # Splitting the text from the file into chunks
-        chunks = splitIntoChunks(plainText, 1000)
+        # Like the CSVs, the table holds each docId once: the last input with a given file name wins
+        uniqueFiles = lastOfEachDocument(fileList)
+        if len(uniqueFiles) < len(fileList):
+            print(f"{len(fileList) - len(uniqueFiles):,} files skipped: a later file in the list has the same name")
+        fileList = uniqueFiles
 
-        # Annotating chunks with BOS and EOS tokens and param tags
-        annotatedChunks = addAnnotations(chunks)
-        
-        ## Diagonistics
-        # Printing the token count for each annotated chunk
-        for i, chunk in enumerate(annotatedChunks):
-            print(f"Chunk {i+1}: {countTokens(chunk)} tokens")
+    # A file that fails is reported at the end instead of stopping the run
+    errors = []
+
+    if processWorkers:
+        for inputPath, numChunks, error in convertFilesInPool(fileList, newSubdir, processWorkers, table):
+            if error is None:
+                print(f"{inputPath}: {numChunks} chunks")
+            else:
+                errors.append((inputPath, error))
+    else:
+        # Plaintext and sentence splits are cached by content hash, so unchanged documents skip parsing
+        cache = textCache.openCache()
+        segmenter = sentenceSplit.getSegmenter(SEGMENTER)
+
+        for inputPath in fileList:
+            try:
+                if table is None:
+                    convertFile(cache, inputPath, segmenter, newSubdir)
+                else:
+                    # A document's chunks are only added once all of them are made, so a failure adds none
+                    chunks = list(documentChunks(cache, inputPath, segmenter))
+                    numChunks = chunkTable.writeDocument(table, documentId(inputPath), chunks)
+                    print(f"{inputPath}: {numChunks} chunks")
+            except Exception as error:
+                errors.append((inputPath, error))
+
+        print(f"Text cache: {cache['hits']:,} hits, {cache['misses']:,} misses")
+        textCache.closeCache(cache)
+
+    if table is not None:
+        chunkTable.closeChunkTable(table)
+        print(f"Wrote {table['numChunks']:,} chunks to {table['path']}")
+
+    print(f"Converted {len(fileList) - len(errors):,} of {len(fileList):,} files")
+    for inputPath, error in errors:
+        print(f"  Failed: {inputPath}: {type(error).__name__}: {error}")
+
+def lastOfEachDocument(fileList):
+    """
+    Drops the inputs whose documentId appears again later in the list. In CSV
+    mode those are the files whose CSV a later input overwrites.
+
+    Parameters:
+    - fileList (list): Paths of the documents.
+
+    Returns:
+    - list: The remaining paths, in input order.
+    """
+    lastIndex = {documentId(inputPath): i for i, inputPath in enumerate(fileList)}
+    return [inputPath for i, inputPath in enumerate(fileList) if lastIndex[documentId(inputPath)] == i]
+
+def convertDocument(cache, inputPath, segmenter, maxTokens=1000):
+    """
+    Streams one corpus document through the pipeline: read, strip and split into
+    sentences (textCache.getSentences), pack the sentences into chunks, annotate.
+    Every stage is a generator, so besides the plaintext and its sentence offsets
+    only the chunk being built is held in memory, never the nine annotated copies of every chunk.
+
+    Parameters:
+    - cache (dict): Text cache from textCache.openCache, or None to not use one.
+    - inputPath (str): Path to the .md file.
+    - segmenter (dict): Sentence segmenter from sentenceSplit.getSegmenter.
+    - maxTokens (int): Maximum number of tokens for each chunk.
+
+    Yields:
+    - Chunk: The annotated chunks, in order.
+    """
+    # Annotating the chunks with BOS and EOS tokens and param tags
+    yield from addAnnotations(documentChunks(cache, inputPath, segmenter, maxTokens))
+
+def documentChunks(cache, inputPath, segmenter, maxTokens=1000):
+    """
+    The read, strip, segment and chunk stages of convertDocument, without the annotations.
+
+    Yields:
+    - Chunk: The chunks of the document, in order.
+    """
+    # Strip out md and the block quote at begining, then split into sentences
+    plainText, paragraphs = textCache.getSentences(cache, inputPath, segmenter)
+
+    # Splitting the text into chunks
+    yield from splitIntoChunks(plainText, maxTokens, paragraphs)
+
+def convertFile(cache, inputPath, segmenter, outputDir, verbose=True):
+    """
+    Converts one corpus document and writes its annotated chunks to a CSV in outputDir,
+    one row at a time. The CSV is written under a temporary name and only
+    replaces the real one once it is complete, so a failure never leaves half a file behind.
+
+    Parameters:
+    - cache (dict): Text cache from textCache.openCache, or None to not use one.
+    - inputPath (str): Path to the .md file.
+    - segmenter (dict): Sentence segmenter from sentenceSplit.getSegmenter.
+    - outputDir (str): Directory for the CSV (see createNewSubdir).
+    - verbose (bool): Print the token count of each annotated chunk.
+
+    Returns:
+    - int: Number of annotated chunks written.
+    """
+    csvFilePath = outputPath(inputPath, outputDir)
+    numChunks = writeConvertedFile(cache, inputPath, segmenter, csvFilePath + ".tmp", verbose)
+    os.replace(csvFilePath + ".tmp", csvFilePath)
+    return numChunks
 
-        # Write the chunks to a file
-        baseName = os.path.splitext(os.path.basename(inputPath))[0] 
-        csvFilePath = os.path.join(newSubdir, f"{baseName.replace('.', '_')}.csv")
+def documentId(inputPath):
+    """
+    Name of a corpus document in the output e.g., google_com for .../google.com.md.
+    """
+    baseName = os.path.splitext(os.path.basename(inputPath))[0] 
+    return baseName.replace('.', '_')
+
+def outputPath(inputPath, outputDir):
+    """
+    Path of the CSV a corpus document is converted to.
+    """
+    return os.path.join(outputDir, f"{documentId(inputPath)}.csv")
 
-        with open(csvFilePath, "w", newline='', encoding='utf-8') as csvfile:
+def writeConvertedFile(cache, inputPath, segmenter, tempPath, verbose=True):
+    """
+    Writes the annotated chunks of one corpus document to tempPath, deleting it again if anything fails.
+
+    Returns:
+    - int: Number of annotated chunks written.
+    """
+    numChunks = 0
+    try:
+        with open(tempPath, "w", newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
-            for chunk in annotatedChunks:
-                writer.writerow([chunk])
+            for chunk in convertDocument(cache, inputPath, segmenter):
+                numChunks += 1
+                ## Diagonistics
+                # Printing the token count for each annotated chunk
+                if verbose:
+                    print(f"Chunk {numChunks}: {chunk.tokenCount} tokens")
+                writer.writerow([chunk.text])
+    except BaseException:
+        os.remove(tempPath)
+        raise
+
+    return numChunks
+
+def convertFilesInPool(fileList, outputDir, processWorkers, table=None):
+    """
+    Converts files on a process pool. Each worker sets up the tokenizer and
+    sentence segmenter once when it starts. Files are handed out largest first
+    so one big document doesn't hold up the end of the run. Workers write to
+    temporary files, which are moved into place in input order, so the output
+    is byte-identical to a serial run even when two inputs share a file name.
+    With a chunk table, workers send back the chunks instead and they are added in input order.
+    The workers don't use the text cache, whose SQLite file takes one writer at a time.
+
+    Parameters:
+    - fileList (list): Paths of the documents.
+    - outputDir (str): Directory for the CSVs (see createNewSubdir).
+    - processWorkers (int): Number of worker processes.
+    - table (dict): Chunk table from chunkTable.openChunkTable, None to write CSVs.
+
+    Returns:
+    - generator: (path, number of annotated chunks, None) for each converted file, or
+      (path, None, exception) if it failed, in input order.
+    """
+    largestFirst = sorted(range(len(fileList)), key=lambda i: _fileSize(fileList[i]), reverse=True)
+    csvFilePaths = [outputPath(inputPath, outputDir) for inputPath in fileList]
+    tempPaths = [f"{csvFilePath}.{i}.tmp" for i, csvFilePath in enumerate(csvFilePaths)]
+
+    executor = ProcessPoolExecutor(max_workers=processWorkers, initializer=_initConvertWorker, initargs=(SEGMENTER,))
+    numDone = 0
+    try:
+        futures = [None] * len(fileList)
+        for i in largestFirst:
+            if table is None:
+                futures[i] = executor.submit(_convertFileInWorker, fileList[i], tempPaths[i])
+            else:
+                futures[i] = executor.submit(_chunkFileInWorker, fileList[i])
+
+        for i, future in enumerate(futures):
+            numDone = i + 1
+            try:
+                result = future.result()
+            except Exception as error:
+                yield fileList[i], None, error
+                continue
+
+            if table is None:
+                os.replace(tempPaths[i], csvFilePaths[i])
+                yield fileList[i], result, None
+            else:
+                yield fileList[i], chunkTable.writeDocument(table, documentId(fileList[i]), result), None
+    finally:
+        # If the caller stops early, drop the files that haven't started yet
+        # and the finished ones that were never moved into place
+        executor.shutdown(wait=True, cancel_futures=True)
+        for tempPath in tempPaths[numDone:]:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+
+def _fileSize(path):
+    """
+    Size of a file for scheduling, 0 if it can't be read (the error is reported when it's converted).
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+_workerSegmenter = None
+
+def _initConvertWorker(segmenterKind):
+    """
+    Process pool initializer: loads the tokenizer and sentence segmenter once per worker.
+    """
+    global _workerSegmenter
+    _workerSegmenter = sentenceSplit.getSegmenter(segmenterKind)
+    countTokens("")
+
+def _convertFileInWorker(inputPath, tempPath):
+    """
+    Converts one file to tempPath. Runs in a convertFilesInPool worker.
+    """
+    return writeConvertedFile(None, inputPath, _workerSegmenter, tempPath, verbose=False)
+
+def _chunkFileInWorker(inputPath):
+    """
+    Chunks one file for a chunk table. Runs in a convertFilesInPool worker.
+    """
+    return list(documentChunks(None, inputPath, _workerSegmenter))
 
 def inputFromList():
     """
@@ -144,6 +379,7 @@ def dataInput():
     print("1. Input from User List")
     print("2. Input from Tranco")
     print("3. Input from CSV")
+    print("4. Input from Metadata Index")
     
     choice = int(input("Choice: "))
 
@@ -156,24 +392,13 @@ def dataInput():
         # fileName = input("Enter the CSV filename (with extension): ")
         fileName = "process_application_data\Corpus_Subset_Selection_Checked.csv"
         fileList = inputFromCSV(fileName)
+    elif choice == 4:
+        fileList = corpusMetadata.inputFromMetadata()
     else:
         print("Invalid choice!")
     
     return fileList
 
-def readFile(filePath):
-    """
-    Reads the content of a file.
-    
-    Parameters:
-    - filePath (str): Path to the file to be read.
-
-    Returns:
-    - str: Content of the file.
-    """
-    with open(filePath, 'r', encoding='utf-8') as file:
-        return file.read()
-
 def createNewSubdir():
     """
     Creates and returns a path to a new subdirectory named after today's date (formatted as YYYY-MM-DD).
@@ -212,169 +437,239 @@ def createNewSubdir():
 
     return newSubdir
 
-def handleLongSentence(sentence, maxTokens):
+# Bytes a chunk may end on when a long sentence is cut (closing punctuation)
+_BREAK_AFTER = set(b".,;:!?)]}\"'-")
+
+def handleLongSentence(sentence, maxTokens, tokenIds=None):
     """"
     Handle sentences that exceed the maxTokens limit by splitting them into 
-    smaller chunks using LLM-friendly tokenization.
+    smaller chunks. The sentence is encoded once and the token ids are cut into
+    windows of at most maxTokens, each cut moved back to the nearest word or
+    punctuation boundary; only the windows are decoded.
     
     Args:
     - sentence (str): The sentence to be handled.
     - maxTokens (int): Maximum number of tokens for each chunk.
+    - tokenIds (list): Optional encoding.encode(sentence), if the caller already has it.
 
     Returns:
-    - List[str]: List of chunks derived from the long sentence.
+    - List[Chunk]: List of chunks derived from the long sentence, each with its token count.
     """
-    words = word_tokenize(sentence)
+    if tokenIds is None:
+        tokenIds = encoding.encode(sentence)
     chunks = []
-    
-    # This list will temporarily hold words for the current chunk.
-    currentChunk = []
-    
-    # Index to keep track of our position in the words list.
-    wordIndex = 0
+    start = 0
 
-    # Continue until all words from the sentence have been processed.
-    while wordIndex < len(words):
-        # Calculate the space left in the current chunk.
-        spaceLeft = maxTokens - countTokens(''.join(currentChunk))
-        
-        # Get a segment of words that can fit into the space left in the current chunk.
-        segment = words[wordIndex:wordIndex + spaceLeft]
-        
-        for word in segment:
-            # Check if the word is a punctuation or if the current chunk is empty.
-            # If so, append the word without adding a space before it.
-            if word in ["!", ",", ".", "?", ";", ":", "(", ")", "{", "}", "[", "]", "'", "\"", "—", "-", "..."] or not currentChunk:
-                currentChunk.append(word)
-            # Otherwise, add a space before appending the word.
-            else:
-                currentChunk.append(' ' + word)
+    while start < len(tokenIds):
+        end = min(start + maxTokens, len(tokenIds))
 
-        # Move the word index forward by the number of words we've just processed.
-        wordIndex += spaceLeft
-        
-        # If the current chunk reaches the max token limit or we've processed all words, finalize the chunk.
-        if countTokens(''.join(currentChunk)) >= maxTokens or wordIndex >= len(words):
-            # Add the current chunk to the chunks list after removing any leading or trailing spaces.
-            chunks.append(''.join(currentChunk).strip())
-            
-            # Reset the current chunk for further processing.
-            currentChunk = []
+        while True:
+            if end < len(tokenIds):
+                end = _snapBack(tokenIds, start, end)
+
+            # Stripping the window can change how its ends encode, so check the count and back off if it grew
+            chunkText = encoding.decode(tokenIds[start:end]).strip()
+            tokenCount = countTokens(chunkText)
+            if tokenCount <= maxTokens or end - start == 1:
+                break
+            end -= 1
+
+        if chunkText:
+            chunks.append(Chunk(chunkText, tokenCount))
+        start = end
 
     return chunks
 
-def splitIntoChunks(text, maxTokens=1000):
-    paragraphs = text.split('\n')
-    chunks = []
+def _snapBack(tokenIds, start, end):
+    """
+    Moves a cut before tokenIds[end] back to the nearest word or punctuation
+    boundary after start: a token starting with whitespace, or one following
+    closing punctuation. Failing that, to a token that starts a whole character.
+
+    Returns:
+    - int: The new cut, end itself if there's no boundary to move to.
+    """
+    for cut in range(end, start, -1):
+        tokenBytes = encoding.decode_single_token_bytes(tokenIds[cut])
+        if tokenBytes[:1].isspace() or encoding.decode_single_token_bytes(tokenIds[cut - 1])[-1] in _BREAK_AFTER:
+            return cut
+
+    # No word boundary in the window, at least don't cut a UTF-8 character in two
+    for cut in range(end, start, -1):
+        if encoding.decode_single_token_bytes(tokenIds[cut])[0] & 0xC0 != 0x80:
+            return cut
+
+    return end
+
+def _firstSafeSplit(text):
+    """
+    Index of the first space in text that directly follows a letter, or -1.
+    cl100k_base's pre-tokenizer always starts a new piece at such a space, and
+    the pieces before it never depend on what comes after it, so for any
+    prefix and suffix: countTokens(prefix + text + suffix) ==
+    countTokens(prefix + text[:i]) + countTokens(text[i:] + suffix).
+    Chunk token counts are kept up with this instead of re-encoding the chunk.
+    """
+    i = text.find(' ', 1)
+    while i != -1 and not text[i - 1].isalpha():
+        i = text.find(' ', i + 1)
+    return i
+
+def _lastSafeSplit(text):
+    """
+    Index of the last space in text that directly follows a letter, or -1 (see _firstSafeSplit).
+    """
+    i = text.rfind(' ')
+    while i > 0 and not text[i - 1].isalpha():
+        i = text.rfind(' ', 0, i)
+    return i if i > 0 else -1
+
+def _splitCounts(text, tokenCount):
+    """
+    Cuts text at its first and last safe split points, so it can be joined to
+    other text by only encoding the short pieces at either end.
+
+    Parameters:
+    - text (str): The text.
+    - tokenCount (int): countTokens(text).
+
+    Returns:
+    - tuple or None: (text before the first split point, token count between the
+      split points, text after the last split point, token count of that text),
+      or None if text has no safe split point.
+    """
+    first = _firstSafeSplit(text)
+    if first == -1:
+        return None
+
+    last = _lastSafeSplit(text)
+    head, tail = text[:first], text[last:]
+    tailTokens = countTokens(tail)
+    return head, tokenCount - countTokens(head) - tailTokens, tail, tailTokens
+
+def _startChunk(sentence, sentenceTokens, pieces):
+    """
+    Token accounting for a chunk holding just one sentence, from its _splitCounts pieces.
+
+    Returns:
+    - tuple: (token count before the chunk's last safe split point, text after it, token count of that text)
+    """
+    if pieces is None:
+        return 0, sentence, sentenceTokens
+    return sentenceTokens - pieces[3], pieces[2], pieces[3]
+
+def splitIntoChunks(text, maxTokens=1000, paragraphs=None):
+    """
+    Packs the sentences of a document into chunks of at most maxTokens tokens,
+    keeping paragraph breaks. Chunks are yielded as soon as they are complete.
+    The " \n" paragraph separator is added after the budget check, so a chunk
+    that ends on paragraph breaks can go over by the separators' tokens.
+    Each sentence is encoded once. The chunk's token count is kept as the count
+    up to its last safe split point plus the short tail after it, so testing a
+    sentence against the chunk only encodes that tail and the start of the sentence.
+
+    Parameters:
+    - text (str): Plaintext of the document.
+    - maxTokens (int): Maximum number of tokens for each chunk, separators aside.
+    - paragraphs (list): Optional pre-split sentences, a list for each paragraph
+      of text.split('\n') (see textCache.getSentences); split with SEGMENTER if not given.
+
+    Yields:
+    - Chunk: The chunks in order, each with its token count.
+    """
+    if paragraphs is None:
+        segment = sentenceSplit.getSegmenter(SEGMENTER)["split"]
+        paragraphs = (segment(paragraph) for paragraph in text.split('\n'))
     currentChunk = []
 
-    for paragraph in paragraphs:
-        sentences = sent_tokenize(paragraph)
+    # countTokens(' '.join(currentChunk)) == chunkTokens + tailTokens, where tail
+    # is the text after the chunk's last safe split point
+    chunkTokens, tail, tailTokens = 0, '', 0
+
+    for sentences in paragraphs:
         for sentence in sentences:
-            sentenceTokens = countTokens(sentence)
+            sentenceIds = encoding.encode(sentence)
+            sentenceTokens = len(sentenceIds)
 
             if sentenceTokens > maxTokens:
                 if len(currentChunk) > 0:
-                    chunks.append(' '.join(currentChunk))
+                    yield Chunk(' '.join(currentChunk), chunkTokens + tailTokens)
                     currentChunk = []
+                    chunkTokens, tail, tailTokens = 0, '', 0
+
+                yield from handleLongSentence(sentence, maxTokens, sentenceIds)
+                continue
 
-                chunks.extend(handleLongSentence(sentence, maxTokens))
+            # Tokens of ' '.join(currentChunk) + ' ' + sentence, re-encoding only around the join
+            pieces = _splitCounts(sentence, sentenceTokens)
+            if pieces is None:
+                joinTokens = countTokens(tail + ' ' + sentence)
+                joinedTokens = chunkTokens + joinTokens
+            else:
+                joinTokens = countTokens(tail + ' ' + pieces[0])
+                joinedTokens = chunkTokens + joinTokens + pieces[1] + pieces[3]
 
             # Add the sentence to current chunk if adding the sentence to the current chunk doesn't exceed the maximum tokens
-            elif countTokens(' '.join(currentChunk) + ' ' + sentence) <= maxTokens:
+            if joinedTokens <= maxTokens:
+                if len(currentChunk) == 0:
+                    chunkTokens, tail, tailTokens = _startChunk(sentence, sentenceTokens, pieces)
+                elif pieces is None:
+                    tail, tailTokens = tail + ' ' + sentence, joinTokens
+                else:
+                    chunkTokens += joinTokens + pieces[1]
+                    tail, tailTokens = pieces[2], pieces[3]
                 currentChunk.append(sentence)
             
             # If the sentence causes the current chunk to exceed the maximum tokens
-            # Add the current chunk to the chunks list and start a new chunk with the current sentence.
+            # Yield the current chunk and start a new chunk with the current sentence.
             else:
-                chunks.append(' '.join(currentChunk))
+                yield Chunk(' '.join(currentChunk), chunkTokens + tailTokens)
                 currentChunk = [sentence]
+                chunkTokens, tail, tailTokens = _startChunk(sentence, sentenceTokens, pieces)
 
         # Add a separator for paragraphs.
         if len(currentChunk) > 0:
             currentChunk.append("\n")
+            tail += ' \n'
+            tailTokens = countTokens(tail)
 
     # After processing all paragraphs, add the remaining chunk.
     if len(currentChunk) > 0:
-        chunks.append(' '.join(currentChunk).strip())
-
-    return chunks
+        chunkText = ' '.join(currentChunk)
+        if chunkText[:1].isspace():
+            yield Chunk(chunkText.strip(), countTokens(chunkText.strip()))
+        else:
+            # Trailing whitespace can't reach back past the last safe split point
+            yield Chunk(chunkText.rstrip(), chunkTokens + countTokens(tail.rstrip()))
 
 def addAnnotations(chunkList):
     """
     Append "Annotate:" to the beginning and "--->" to the end of each item in the chunk list.
-    Does this 9 times for the 9 CI-GKC parameters: 'Sender', 'Subject', 'Consequence', 'Modality', 'Recipient', 
+    Does this 9 times for the 9 CI-GKC parameters in PARAMS: 'Sender', 'Subject', 'Consequence', 'Modality', 'Recipient', 
               'Transmission-Principle', 'Condition', 'Aim', 'Attribute'
 
     Args:
-    - chunkList (List[str]): List of text chunks.
+    - chunkList (Iterable[Chunk]): Text chunks with their token counts, e.g., from splitIntoChunks.
 
-    Returns:
-    - List[str]: List of annotated text chunks.
+    Yields:
+    - Chunk: The annotated text chunks with their token counts, nine per input chunk.
     """
-    # List of parameters
-    params = ['Sender', 'Subject', 'Consequence', 'Modality', 'Recipient', 
-              'Transmission-Principle', 'Condition', 'Aim', 'Attribute']
-    
-    # List to hold the annotated chunks
-    annotatedList = []
-
     # For every chunk in the chunkList
     for chunk in chunkList:
-        # For every parameter in params
-        for param in params:
-            # Create the desired format and append it to the annotatedList
-            annotatedList.append("Annotate:" + chunk + " " + param + "--->")
-    
-    return annotatedList
-
-def stripMarkdown(markdownContent):
-    """
-    Strips common Markdown elements from a given string containing Markdown content.
-
-    Parameters:
-    - markdownContent (str): The content string with Markdown formatting.
-
-    Returns:
-    - str: The content with Markdown elements removed.
-    """
-    
-    content = markdownContent
-
-    ### REMOVE THE BLOCK QUOTE AT THE TOP OF THE FILE ##
-    # This will match everything starting from the first block quote to the newline just before the first top-level heading.
-    pattern = r'^(?:>.*\n)+\n(?=# )'
-
-    # Replace the matched block quote with an empty string
-    content = re.sub(pattern, '', content, flags=re.MULTILINE)
-
-    # Links: ![alt_text](url) or [link_text](url)
-    content = re.sub(r'!\[.*?\]\(.*?\)', '', content)  # Images
-    content = re.sub(r'\[.*?\]\(.*?\)', '', content)   # Links
-
-    # Headers: # or ## or ### etc.
-    content = re.sub(r'#+', '', content)
-
-    # Emphasis: *italic* or **bold** or ***bolditalic***
-    content = re.sub(r'\*+', '', content)
-    
-    ## Jake: leaving this in because we finetuned on lists
-    # Lists: - item or * item or + item
-    # content = re.sub(r'^[-\*+]\s+', '', content, flags=re.M)
-
-    # Inline Code: `code`
-    content = re.sub(r'`', '', content)
-
-    # Blockquotes: > quote
-    content = re.sub(r'^>\s+', '', content, flags=re.M)
-
-    # Horizontal lines: --- or *** or - - -
-    content = re.sub(r'^[\-_*]\s*[\-_*]\s*[\-_*]\s*$', '', content, flags=re.M)
-
-    # Code blocks: ```code```
-    content = re.sub(r'```.*?```', '', content, flags=re.S)  
-
-    return content
+        # The annotations only change the token count around the ends of the chunk
+        ends = _splitCounts(chunk.text, chunk.tokenCount)
+        if ends is not None:
+            headTokens = countTokens("Annotate:" + ends[0]) + ends[1]
+
+        # For every parameter in PARAMS
+        for param in PARAMS:
+            # Create the desired format and yield it
+            suffix = " " + param + "--->"
+            if ends is None:
+                tokenCount = countTokens("Annotate:" + chunk.text + suffix)
+            else:
+                tokenCount = headTokens + countTokens(ends[2] + suffix)
+            yield Chunk("Annotate:" + chunk.text + suffix, tokenCount)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,445 @@
+"""
+Builds a persistent on-disk catalog (SQLite) of the privacy policy corpus so the
+lookup functions in gatherPopularSites and checkSheetItems can answer queries
+with indexed lookups instead of re-walking the corpus and re-parsing every
+filename on every call.
+The catalog holds each policy's absolute path, parsed subdomain/domain/suffix, size and mtime,
+so its paths resolve whichever directory the lookups run from.
+It records the corpus commit it was built at, so after a `git pull` only the
+changed policies need to be re-cataloged (see refreshCatalog).
+"""
+
+import os, sqlite3, subprocess, time
+
+import corpusLookup, domainParser
+
+# Catalog lives next to the tranco cache by default
+DEFAULT_CATALOG_PATH = ".corpus_catalog.sqlite"
+
+# Bump whenever the catalog's contents change meaning; older catalogs are rebuilt
+# (2: absolute paths)
+CATALOG_VERSION = 2
+
+# How many file names are handed to the domain parser at once
+PARSE_BATCH_SIZE = 5000
+
+
+def buildCatalog(directory, catalogPath=DEFAULT_CATALOG_PATH, workers=None):
+    """
+    Walks the corpus once and writes every policy file into a fresh catalog.
+    Rows are inserted in walk order so "first match" queries agree with the
+    recursive scans. Paths are stored absolute.
+
+    Parameters:
+    - directory (str): Root of the corpus e.g., "../privacy-policy-historical-master".
+    - catalogPath (str): Where to write the SQLite catalog.
+    - workers (int): List the corpus on this many threads (see corpusLookup.walkCorpus).
+
+    Returns:
+    - sqlite3.Connection: Open connection to the new catalog.
+    """
+    if os.path.exists(catalogPath):
+        os.remove(catalogPath)
+
+    catalog = sqlite3.connect(catalogPath)
+    catalog.executescript("""
+        CREATE TABLE policies (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            name TEXT NOT NULL,
+            subdomain TEXT NOT NULL,
+            domain TEXT NOT NULL,
+            suffix TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL
+        );
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+
+    root = os.path.abspath(directory)
+    catalog.executemany(
+        "INSERT INTO policies (path, name, subdomain, domain, suffix, size, mtime) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        _catalogRows(root, workers)
+    )
+
+    # Index after the bulk insert, it is much faster than keeping them up to date row by row
+    catalog.executescript("""
+        CREATE INDEX idx_policies_domain ON policies (domain);
+        CREATE INDEX idx_policies_suffix ON policies (suffix);
+    """)
+    catalog.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+        ("directory", root),
+        ("version", str(CATALOG_VERSION)),
+        ("builtAt", str(time.time())),
+        ("gitCommit", _gitHead(directory)),
+    ])
+    catalog.commit()
+
+    return catalog
+
+
+def _catalogRows(path, workers=None):
+    """
+    Yields one catalog row per file under path, in walk order.
+
+    Parameters:
+    - path (str): Root of the corpus.
+    - workers (int): Number of listing threads, None for a serial walk.
+
+    Returns:
+    - generator: (path, name, subdomain, domain, suffix, size, mtime) tuples.
+    """
+    gitDir = os.path.join(path, ".git") + os.sep
+
+    batch = []
+    for entry in corpusLookup.walkCorpus(path, workers):
+        # The corpus is a git checkout, its object store isn't part of the corpus
+        if entry.path.startswith(gitDir):
+            continue
+
+        batch.append(entry)
+        if len(batch) == PARSE_BATCH_SIZE:
+            yield from _parseBatch(batch)
+            batch = []
+
+    yield from _parseBatch(batch)
+
+
+def _parseBatch(entries):
+    """
+    Parses a batch of file names in one domainParser call.
+
+    Parameters:
+    - entries (list): os.DirEntry objects for corpus files.
+
+    Returns:
+    - generator: (path, name, subdomain, domain, suffix, size, mtime) tuples.
+    """
+    yield from _parsePaths([entry.path for entry in entries], [entry.stat() for entry in entries])
+
+
+def _parsePaths(paths, stats):
+    """
+    Builds catalog rows for a batch of file paths in one domainParser call.
+
+    Parameters:
+    - paths (list): Paths to corpus files.
+    - stats (list): os.stat_result for each path.
+
+    Returns:
+    - generator: (path, name, subdomain, domain, suffix, size, mtime) tuples.
+    """
+    # Removing the actual file extension for the domain parser to work correctly
+    baseNames = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+
+    for path, stat, baseName, extracted in zip(paths, stats, baseNames, domainParser.extractMany(baseNames)):
+        yield (path, baseName, extracted.subdomain, extracted.domain, extracted.suffix, stat.st_size, stat.st_mtime)
+
+
+def loadCatalog(directory, catalogPath=DEFAULT_CATALOG_PATH, rebuild=False, workers=None, refresh=None):
+    """
+    Opens the catalog for a corpus, building it first if it doesn't exist yet,
+    was built for a different corpus directory or by an older CATALOG_VERSION.
+
+    Parameters:
+    - directory (str): Root of the corpus.
+    - catalogPath (str): Location of the SQLite catalog.
+    - rebuild (bool): Force a fresh walk of the corpus.
+    - workers (int): Listing threads used if the catalog has to be built or refreshed.
+    - refresh (bool or None): True always runs refreshCatalog, False never does.
+      None (the default) only refreshes when the corpus checkout has moved to a
+      new commit, which is a cheap git diff.
+
+    Returns:
+    - sqlite3.Connection: Open connection to the catalog.
+    """
+    if rebuild or not os.path.exists(catalogPath):
+        return buildCatalog(directory, catalogPath, workers)
+
+    catalog = sqlite3.connect(catalogPath)
+    if (_getMeta(catalog, "directory") != os.path.abspath(directory)
+            or _getMeta(catalog, "version") != str(CATALOG_VERSION)):
+        catalog.close()
+        return buildCatalog(directory, catalogPath, workers)
+
+    if refresh is None:
+        builtCommit = _getMeta(catalog, "gitCommit")
+        refresh = builtCommit is not None and builtCommit != _gitHead(directory)
+
+    if refresh:
+        refreshCatalog(catalog, directory, workers)
+
+    return catalog
+
+
+def refreshCatalog(catalog, directory, workers=None):
+    """
+    Brings an existing catalog up to date without rebuilding it.
+    If the catalog was built from a git checkout, only the policies that a
+    `git diff` between the recorded commit and HEAD reports as added, removed,
+    renamed or modified are touched. Otherwise every file's size and mtime are
+    compared to the catalog, which still skips re-parsing unchanged files.
+    New policies are appended, so they sort after existing ones for "first match" queries.
+
+    Parameters:
+    - catalog (sqlite3.Connection): Open catalog.
+    - directory (str): Root of the corpus.
+    - workers (int): Listing threads for the mtime comparison.
+
+    Returns:
+    - tuple: (numAdded, numRemoved, numUpdated)
+    """
+    root = os.path.abspath(directory)
+    builtCommit = _getMeta(catalog, "gitCommit")
+    headCommit = _gitHead(directory)
+
+    changes = None
+    if builtCommit is not None and headCommit is not None:
+        changes = _gitChanges(directory, builtCommit, headCommit)
+
+    if changes is not None:
+        added, removed, updated = changes
+        # git reports paths relative to the corpus root with "/" separators
+        added = [os.path.join(root, *relPath.split("/")) for relPath in added]
+        removed = [os.path.join(root, *relPath.split("/")) for relPath in removed]
+        updated = [os.path.join(root, *relPath.split("/")) for relPath in updated]
+    else:
+        added, removed, updated = _mtimeChanges(catalog, root, workers)
+
+    # Skip anything git reports that isn't on disk (e.g., a sparse checkout)
+    added = [path for path in added if os.path.isfile(path)]
+    updated = [path for path in updated if os.path.isfile(path)]
+
+    catalog.executemany("DELETE FROM policies WHERE path = ?", [(path,) for path in removed])
+    catalog.executemany(
+        "INSERT INTO policies (path, name, subdomain, domain, suffix, size, mtime) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        _parsePaths(added, [os.stat(path) for path in added])
+    )
+    # Same path means the same parsed name, only size and mtime change
+    catalog.executemany(
+        "UPDATE policies SET size = ?, mtime = ? WHERE path = ?",
+        [(stat.st_size, stat.st_mtime, path) for path, stat in ((path, os.stat(path)) for path in updated)]
+    )
+
+    catalog.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+        ("refreshedAt", str(time.time())),
+        ("gitCommit", headCommit),
+    ])
+    catalog.commit()
+
+    return len(added), len(removed), len(updated)
+
+
+def _gitHead(directory):
+    """
+    Returns the commit the corpus checkout is at, or None if it isn't a git repo.
+    """
+    try:
+        result = subprocess.run(["git", "-C", directory, "rev-parse", "HEAD"],
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _gitChanges(directory, fromCommit, toCommit):
+    """
+    Lists the policy files that changed between two commits of the corpus.
+
+    Returns:
+    - tuple or None: (added, removed, updated) lists of paths relative to
+      directory, or None if git can't produce the diff (e.g., history was rewritten).
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", directory, "diff", "--name-status", "-z", "-M", "--relative", fromCommit, toCommit],
+            capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    added, removed, updated = [], [], []
+    fields = result.stdout.split("\0")
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i]
+        if status.startswith("R"):
+            # Renames list the old path then the new one
+            removed.append(fields[i + 1])
+            added.append(fields[i + 2])
+            i += 3
+            continue
+
+        if status.startswith("A") or status.startswith("C"):
+            # Copies list the source then the new path, only the new one matters
+            added.append(fields[i + 2] if status.startswith("C") else fields[i + 1])
+            i += 3 if status.startswith("C") else 2
+            continue
+
+        if status.startswith("D"):
+            removed.append(fields[i + 1])
+        else:
+            # M (modified) and T (type change) keep their path but change size/mtime
+            updated.append(fields[i + 1])
+        i += 2
+
+    return added, removed, updated
+
+
+def _mtimeChanges(catalog, root, workers=None):
+    """
+    Fallback for corpora that aren't git checkouts: walks the tree and compares
+    each file's size and mtime with the catalog.
+
+    Returns:
+    - tuple: (added, removed, updated) lists of paths.
+    """
+    known = {path: (size, mtime) for path, size, mtime in catalog.execute("SELECT path, size, mtime FROM policies")}
+    gitDir = os.path.join(root, ".git") + os.sep
+
+    added, updated = [], []
+    for entry in corpusLookup.walkCorpus(root, workers):
+        if entry.path.startswith(gitDir):
+            continue
+
+        stat = entry.stat()
+        previous = known.pop(entry.path, None)
+        if previous is None:
+            added.append(entry.path)
+        elif previous != (stat.st_size, stat.st_mtime):
+            updated.append(entry.path)
+
+    # Whatever wasn't seen on disk has been removed
+    removed = list(known)
+
+    return added, removed, updated
+
+
+def _getMeta(catalog, key):
+    """
+    Reads one value from the catalog's meta table, None if it isn't set.
+    """
+    row = catalog.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def catalogExactMatchTLD(catalog, website, bareCom=True):
+    """
+    Catalog version of findExactMatchInDirTLD: returns a single policy that
+    exactly matches the website's domain, prioritizing .com.
+
+    Parameters:
+    - catalog (sqlite3.Connection): Open catalog.
+    - website (str): The website URL or name to use for matching.
+    - bareCom (bool): When true a .com only wins if it has no subdomain
+      (gatherPopularSites' rule); checkSheetItems accepts any .com.
+
+    Returns:
+    - str or None: Returns the file path if a match is found, or None otherwise.
+    """
+    # Take in website URL or name
+    if "." in website:
+        domain = domainParser.extract(website).domain
+    else:
+        domain = website
+    domain = domain.lower()
+
+    if bareCom:
+        comRule = "suffix = 'com' AND subdomain = ''"
+    else:
+        comRule = "suffix = 'com'"
+
+    row = catalog.execute(
+        f"SELECT path FROM policies WHERE domain = ? ORDER BY ({comRule}) DESC, id LIMIT 1",
+        (domain,)
+    ).fetchone()
+
+    return row[0] if row else None
+
+
+def catalogExactMatches(catalog, websites, limit=5):
+    """
+    Catalog version of findMatchingFiles(..., exact=True).
+
+    Parameters:
+    - catalog (sqlite3.Connection): Open catalog.
+    - websites (list): A list of website URLs to use for matching.
+    - limit (int): Maximum number of matches kept per domain.
+
+    Returns:
+    - dict: Dictionary with domains as keys and lists of matching file paths as values.
+    """
+    matches = {parts.domain: [] for parts in domainParser.extractMany(websites)}
+
+    for domain in matches:
+        rows = catalog.execute(
+            "SELECT path FROM policies WHERE domain = ? ORDER BY id LIMIT ?",
+            (domain, limit)
+        )
+        matches[domain] = [path for (path,) in rows]
+
+    return matches
+
+
+def catalogFuzzyMatches(catalog, websites, limit=5):
+    """
+    Catalog version of findMatchingFiles(..., exact=False); a domain matches
+    any file whose name contains it.
+
+    Parameters:
+    - catalog (sqlite3.Connection): Open catalog.
+    - websites (list): A list of website URLs to use for matching.
+    - limit (int): Maximum number of matches kept per domain.
+
+    Returns:
+    - dict: Dictionary with domains as keys and lists of matching file paths as values.
+    """
+    matches = {parts.domain: [] for parts in domainParser.extractMany(websites)}
+
+    for domain in matches:
+        rows = catalog.execute(
+            "SELECT path FROM policies WHERE instr(name, ?) > 0 ORDER BY id LIMIT ?",
+            (domain, limit)
+        )
+        matches[domain] = [path for (path,) in rows]
+
+    return matches
+
+
+def catalogFilesByTLDs(catalog, gtlds):
+    """
+    Catalog version of findFilesByTLDs.
+
+    Parameters:
+    - catalog (sqlite3.Connection): Open catalog.
+    - gtlds (list): List of gTLDs (like ['.com', '.org', ...]) to search for.
+
+    Returns:
+    - dict: A dictionary with gTLDs as keys and lists of matching file paths as values.
+    """
+    matches = {gtld: [] for gtld in gtlds}
+
+    for gtld in matches:
+        # findFilesByTLDs compares against '.' + suffix, so anything else never matches
+        if not gtld.startswith('.'):
+            continue
+        rows = catalog.execute(
+            "SELECT path FROM policies WHERE suffix = ? ORDER BY id",
+            (gtld[1:],)
+        )
+        matches[gtld] = [path for (path,) in rows]
+
+    return matches
+
+
+if __name__ == '__main__':
+    # Build the catalog for the default corpus location, or bring it up to date after a pull
+    directory = "../privacy-policy-historical-master"
+    if os.path.exists(DEFAULT_CATALOG_PATH):
+        catalog = loadCatalog(directory, refresh=False)
+        numAdded, numRemoved, numUpdated = refreshCatalog(catalog, directory)
+        print(f"Refreshed catalog: {numAdded:,} added, {numRemoved:,} removed, {numUpdated:,} updated")
+    else:
+        catalog = buildCatalog(directory)
+    numFiles = catalog.execute("SELECT COUNT(*) FROM policies").fetchone()[0]
+    print(f"Cataloged {numFiles:,} policies from {directory} into {DEFAULT_CATALOG_PATH}")
@@ -0,0 +1,237 @@
+"""
+Index-free lookups against the privacy policy corpus.
+The corpus stores every policy under a letter-shard prefix of its file name
+e.g., g/ge/gea/geappliances.com.md, so a domain's policies can be found by
+listing only the shard directories on its path instead of walking the whole tree.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import domainParser
+
+
+def walkCorpus(path, workers=None):
+    """
+    Yields every file under path as an os.DirEntry, depth first with the
+    entries of each directory sorted by name (see listDir), so the order is
+    the same with or without workers and from one run to the next.
+
+    With workers set, directories are listed ahead of the walk on a thread pool:
+    the subdirectories of every directory the walk enters are submitted at once,
+    and each directory's files are yielded as soon as its listing is ready.
+    On a network-mounted corpus this hides the directory listing latency.
+    No extra stat calls are made, is_dir() uses the type returned by the listing.
+
+    Parameters:
+    - path (str): Root of the corpus.
+    - workers (int): Number of listing threads, None for a serial walk.
+
+    Returns:
+    - generator: os.DirEntry objects for the files.
+    """
+    if not workers:
+        yield from _walkSerial(path)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        yield from _walkPrefetched(executor, executor.submit(listDir, path))
+    finally:
+        # Callers that stop early shouldn't wait on the remaining listings
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def listDir(path):
+    """
+    The entries of one directory, sorted by name. Every corpus walk lists
+    directories through this so their results don't depend on scandir order.
+
+    Parameters:
+    - path (str): The directory.
+
+    Returns:
+    - list: os.DirEntry objects.
+    """
+    return sorted(os.scandir(path), key=lambda entry: entry.name)
+
+
+def _walkSerial(path):
+    """
+    Recursive walk used by walkCorpus when no workers are requested.
+
+    Parameters:
+    - path (str): The current directory path.
+
+    Returns:
+    - generator: os.DirEntry objects for the files.
+    """
+    for entry in listDir(path):
+        if entry.is_dir():
+            yield from _walkSerial(entry.path)
+        else:
+            yield entry
+
+
+def _walkPrefetched(executor, listing):
+    """
+    Recursive walk used by walkCorpus with workers.
+
+    Parameters:
+    - executor (ThreadPoolExecutor): The listing threads.
+    - listing (Future): listDir of the current directory.
+
+    Returns:
+    - generator: os.DirEntry objects for the files.
+    """
+    entries = listing.result()
+
+    # List every subdirectory before descending into the first, so the pool stays ahead of the walk
+    subListings = {entry.path: executor.submit(listDir, entry.path) for entry in entries if entry.is_dir()}
+
+    for entry in entries:
+        if entry.is_dir():
+            yield from _walkPrefetched(executor, subListings[entry.path])
+        else:
+            yield entry
+
+
+def websiteDomain(website):
+    """
+    Normalizes a website URL or name to the lowercase domain used for matching.
+
+    Parameters:
+    - website (str): The website URL or name e.g., "www.google.com" or "google".
+
+    Returns:
+    - str: The domain e.g., "google".
+    """
+    # Take in website URL or name
+    if "." in website:
+        domain = domainParser.extract(website).domain
+    else:
+        domain = website
+
+    return domain.lower()
+
+
+def listShard(path, domain):
+    """
+    Lists the files in the shard directories a domain's policies live in.
+    Starting at the corpus root, only subdirectories whose name is a prefix of
+    "<domain>." (or starts with it, for short domains like x/x./x.c/) are entered.
+
+    Parameters:
+    - path (str): Root of the corpus.
+    - domain (str): Lowercase domain e.g., "geappliances".
+
+    Returns:
+    - list: os.DirEntry objects for the files found along the shard path.
+    """
+    key = domain + "."
+    files = []
+    dirsToList = [path]
+
+    while dirsToList:
+        currentDir = dirsToList.pop(0)
+        try:
+            entries = listDir(currentDir)
+        except FileNotFoundError:
+            continue
+
+        for entry in entries:
+            if entry.is_dir():
+                dirName = entry.name.lower()
+                if key.startswith(dirName) or dirName.startswith(key):
+                    dirsToList.append(entry.path)
+            else:
+                files.append(entry)
+
+    return files
+
+
+def findExactMatchInShard(path, website, bareCom=True):
+    """
+    Finds the policy that exactly matches a website by probing only its shard
+    directories, prioritizing .com domains. Needs no prebuilt index.
+
+    Only files named "<domain>.<suffix>.md" live in the domain's shard, so
+    policies stored under a subdomain (e.g., www.yahoo.com.md) are not found
+    this way; use a full scan or the catalog for those.
+
+    Parameters:
+    - path (str): Root of the corpus.
+    - website (str): The website URL or name to use for matching.
+    - bareCom (bool): When true a .com only wins if it has no subdomain
+      (gatherPopularSites' rule); checkSheetItems accepts any .com.
+
+    Returns:
+    - str or None: Returns the file path if a match is found, or None otherwise.
+    """
+    domain = websiteDomain(website)
+    if not domain:
+        return None
+
+    key = domain + "."
+    foundOtherPath = None  # Store path if any other TLD is found
+
+    for entry in listShard(path, domain):
+        # Cheap prefix check before parsing the name
+        if not entry.name.lower().startswith(key):
+            continue
+
+        baseName, _ = os.path.splitext(entry.name)
+        extractedResult = domainParser.extract(baseName)
+        if extractedResult.domain != domain:
+            continue
+
+        if extractedResult.suffix == "com" and (extractedResult.subdomain == '' or not bareCom):
+            return entry.path
+        elif not foundOtherPath:
+            foundOtherPath = entry.path
+
+    return foundOtherPath
+
+
+def findExactMatchesInDir(path, websites, bareCom=True, workers=None):
+    """
+    Resolves a whole batch of websites with a single traversal of the corpus.
+    Each file name is parsed once and checked against a set of target domains,
+    keeping the best match per domain under the same .com-priority rule as
+    the one-at-a-time lookups. Cost is O(files + targets) instead of
+    O(files x targets).
+
+    Parameters:
+    - path (str): Root of the corpus.
+    - websites (list): Website URLs or names to use for matching.
+    - bareCom (bool): When true a .com only wins if it has no subdomain
+      (gatherPopularSites' rule); checkSheetItems accepts any .com.
+    - workers (int): Number of listing threads for walkCorpus, None for a serial walk.
+
+    Returns:
+    - dict: Maps each website's domain (see websiteDomain) to a file path or None.
+    """
+    targets = {websiteDomain(website) for website in websites}
+    bestPaths = {domain: None for domain in targets}
+    pending = set(targets)  # Domains that haven't found their .com yet
+
+    for entry in walkCorpus(path, workers):
+        # Stop as soon as every target has its .com match
+        if not pending:
+            break
+
+        baseName, _ = os.path.splitext(entry.name)
+        extractedResult = domainParser.extract(baseName)
+        domain = extractedResult.domain
+
+        if domain not in pending:
+            continue
+
+        if extractedResult.suffix == "com" and (extractedResult.subdomain == '' or not bareCom):
+            bestPaths[domain] = entry.path
+            pending.discard(domain)
+        # Otherwise keep the first non-.com match
+        elif bestPaths[domain] is None:
+            bestPaths[domain] = entry.path
+
+    return bestPaths
@@ -0,0 +1,295 @@
+"""
+Columnar metadata index for the privacy policy corpus.
+Every corpus document opens with a `>` block quote of metadata e.g.,
+    > **Domain:** geappliances.com
+    > **Date:** 2019-06-13
+which stripMarkdown throws away. This module reads only those header lines
+once per document and stores them, together with the path, parsed domain,
+suffix and byte size from the corpus catalog, in a Parquet table.
+Subsets for convert_corpus and count_corpus can then be selected from the
+table (see selectDocuments) without opening any .md file.
+"""
+
+import os, re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import corpusCatalog, corpusLookup
+
+# Index lives next to the catalog by default
+DEFAULT_METADATA_PATH = ".corpus_metadata.parquet"
+
+# Bump whenever the index's contents change meaning; older indexes are rebuilt
+# (2: dates in any format, not just the first value's)
+METADATA_VERSION = 2
+
+# Header fields become columns named header_<field> e.g., header_date
+HEADER_PREFIX = "header_"
+
+# "> **Key:** value", "> **Key**: value" or "> Key: value"
+_boldFieldRe = re.compile(r"^>\s*\*\*(.+?):?\*\*:?\s*(.*)$")
+_plainFieldRe = re.compile(r"^>\s*([^:*]+):\s*(.*)$")
+
+# Catalog columns copied into the index
+_CATALOG_COLUMNS = ["path", "domain", "suffix", "size", "mtime"]
+
+
+def readHeader(filePath):
+    """
+    Parses the metadata block quote at the top of a corpus document.
+    Stops at the first line that isn't part of the block quote, so only the
+    first few hundred bytes of the file are read.
+
+    Parameters:
+    - filePath (str): Path to the .md file.
+
+    Returns:
+    - tuple: (dict of header_<field> -> value, size of the header in bytes)
+    """
+    fields = {}
+    headerSize = 0
+
+    with open(filePath, 'rb') as file:
+        for rawLine in file:
+            if not rawLine.startswith(b">"):
+                break
+            headerSize += len(rawLine)
+
+            line = rawLine.decode('utf-8', 'replace').strip()
+            match = _boldFieldRe.match(line) or _plainFieldRe.match(line)
+            if match:
+                fields[_columnName(match.group(1))] = match.group(2).strip()
+
+    return fields, headerSize
+
+
+def _columnName(field):
+    """
+    Turns a header field name into a column name e.g., "Last Updated" -> "header_last_updated".
+    """
+    return HEADER_PREFIX + re.sub(r"[^0-9a-z]+", "_", field.strip().lower()).strip("_")
+
+
+def _metadataTable(catalogRows, workers=None):
+    """
+    Reads the headers for a list of catalog rows and returns them as a DataFrame.
+
+    Parameters:
+    - catalogRows (list): (path, domain, suffix, size, mtime) tuples.
+    - workers (int): Read the headers on this many threads, None to read serially.
+
+    Returns:
+    - pandas.DataFrame: One row per document.
+    """
+    paths = [row[0] for row in catalogRows]
+    if workers:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            headers = list(executor.map(readHeader, paths))
+    else:
+        headers = [readHeader(path) for path in paths]
+
+    table = pd.DataFrame(catalogRows, columns=_CATALOG_COLUMNS)
+    table["headerSize"] = [headerSize for _, headerSize in headers]
+    fields = pd.DataFrame([fields for fields, _ in headers], index=table.index)
+
+    return _typeColumns(pd.concat([table, fields], axis=1))
+
+
+def _typeColumns(table):
+    """
+    Converts header date fields to datetimes and repeated strings to categoricals.
+    Each date is parsed on its own (headers mix formats e.g., "2019-05-01" and
+    "May 3, 2020"); values that still can't be parsed become NaT and are counted.
+    """
+    for column in table.columns:
+        if column.startswith(HEADER_PREFIX) and "date" in column and not pd.api.types.is_datetime64_any_dtype(table[column]):
+            dates = pd.to_datetime(table[column], format="mixed", errors="coerce", utc=True)
+            numFailed = int((table[column].notna() & dates.isna()).sum())
+            if numFailed:
+                print(f"{numFailed:,} {column} values couldn't be parsed as dates and were left empty")
+            table[column] = dates
+
+    for column in ["domain", "suffix"]:
+        table[column] = table[column].astype("category")
+
+    return table
+
+
+def _catalogRowsFor(catalog):
+    """
+    Returns every policy in the catalog as (path, domain, suffix, size, mtime), in catalog order.
+    """
+    return catalog.execute(f"SELECT {', '.join(_CATALOG_COLUMNS)} FROM policies ORDER BY id").fetchall()
+
+
+def buildMetadata(catalog, metadataPath=DEFAULT_METADATA_PATH, workers=None):
+    """
+    Reads the header of every policy in the catalog and writes a fresh index.
+
+    Parameters:
+    - catalog (sqlite3.Connection): Catalog from corpusCatalog.loadCatalog.
+    - metadataPath (str): Where to write the Parquet file.
+    - workers (int): Read the headers on this many threads.
+
+    Returns:
+    - pandas.DataFrame: The index.
+    """
+    table = _metadataTable(_catalogRowsFor(catalog), workers)
+    _writeMetadata(table, metadataPath)
+    return table
+
+
+def _writeMetadata(table, metadataPath):
+    """
+    Writes the index with METADATA_VERSION in the Parquet file's metadata.
+    """
+    arrowTable = pa.Table.from_pandas(table, preserve_index=False)
+    schemaMetadata = dict(arrowTable.schema.metadata or {})
+    schemaMetadata[b"metadataVersion"] = str(METADATA_VERSION).encode()
+    pq.write_table(arrowTable.replace_schema_metadata(schemaMetadata), metadataPath)
+
+
+def _metadataVersion(metadataPath):
+    """
+    METADATA_VERSION of an index file, None if it predates versioning.
+    """
+    version = (pq.read_schema(metadataPath).metadata or {}).get(b"metadataVersion")
+    return int(version) if version is not None else None
+
+
+def loadMetadata(catalog, metadataPath=DEFAULT_METADATA_PATH, rebuild=False, workers=None):
+    """
+    Opens the metadata index, building it first if it doesn't exist yet or was
+    built by an older METADATA_VERSION.
+    An existing index is brought in line with the catalog: policies that were
+    removed are dropped, and only new or changed policies (by size and mtime)
+    have their headers read again.
+
+    Parameters:
+    - catalog (sqlite3.Connection): Catalog from corpusCatalog.loadCatalog.
+    - metadataPath (str): Location of the Parquet file.
+    - rebuild (bool): Force every header to be read again.
+    - workers (int): Read the headers on this many threads.
+
+    Returns:
+    - pandas.DataFrame: The index, in catalog order.
+    """
+    if rebuild or not os.path.exists(metadataPath) or _metadataVersion(metadataPath) != METADATA_VERSION:
+        return buildMetadata(catalog, metadataPath, workers)
+
+    table = pd.read_parquet(metadataPath)
+    catalogRows = _catalogRowsFor(catalog)
+
+    indexed = dict(zip(table["path"], zip(table["size"], table["mtime"])))
+    staleRows = [row for row in catalogRows if indexed.get(row[0]) != (row[3], row[4])]
+    catalogPaths = {row[0] for row in catalogRows}
+
+    if not staleRows and len(catalogPaths) == len(table):
+        return table
+
+    # Keep the rows that are still current and read the rest
+    stalePaths = {row[0] for row in staleRows}
+    keep = table["path"].isin(catalogPaths) & ~table["path"].isin(stalePaths)
+    parts = [table[keep].astype({"domain": str, "suffix": str})]
+    if staleRows:
+        parts.append(_metadataTable(staleRows, workers).astype({"domain": str, "suffix": str}))
+
+    table = pd.concat(parts, ignore_index=True)
+    order = {row[0]: i for i, row in enumerate(catalogRows)}
+    table = table.sort_values("path", key=lambda paths: paths.map(order), ignore_index=True)
+    table = _typeColumns(table)
+
+    _writeMetadata(table, metadataPath)
+    return table
+
+
+def selectDocuments(metadata, websites=None, suffixes=None, minSize=None, maxSize=None,
+                    dateColumn=HEADER_PREFIX + "date", since=None, until=None, requireFields=None):
+    """
+    Picks documents out of the metadata index. Every filter left as None is ignored.
+
+    Parameters:
+    - metadata (pandas.DataFrame): Index from loadMetadata.
+    - websites (list): Website URLs or names; keeps policies whose domain matches one of them.
+    - suffixes (list): Public suffixes to keep e.g., ["com", "co.uk"].
+    - minSize (int): Smallest document size in bytes.
+    - maxSize (int): Largest document size in bytes.
+    - dateColumn (str): Header date column used by since/until.
+    - since (str): Keep documents dated on or after this day e.g., "2019-01-01".
+    - until (str): Keep documents dated on or before this day.
+    - requireFields (list): Header fields that must be present e.g., ["source"].
+
+    Returns:
+    - list: Full file paths of the selected documents, in catalog order.
+    """
+    mask = pd.Series(True, index=metadata.index)
+
+    if websites is not None:
+        mask &= metadata["domain"].isin({corpusLookup.websiteDomain(website) for website in websites})
+    if suffixes is not None:
+        mask &= metadata["suffix"].isin(suffixes)
+    if minSize is not None:
+        mask &= metadata["size"] >= minSize
+    if maxSize is not None:
+        mask &= metadata["size"] <= maxSize
+
+    if since is not None or until is not None:
+        if dateColumn not in metadata:
+            return []
+        dates = metadata[dateColumn]
+        if since is not None:
+            mask &= dates >= pd.Timestamp(since, tz="UTC")
+        if until is not None:
+            mask &= dates < pd.Timestamp(until, tz="UTC") + pd.Timedelta(days=1)
+
+    for field in requireFields or []:
+        column = _columnName(field)
+        if column not in metadata:
+            return []
+        mask &= metadata[column].notna()
+
+    return metadata.loc[mask, "path"].tolist()
+
+
+def inputFromMetadata(directory="../privacy-policy-historical-master"):
+    """
+    Terminal front end to selectDocuments used by count_corpus and convert_corpus.
+    Blank answers skip a filter.
+
+    Parameters:
+    - directory (str): Root of the corpus.
+
+    Returns:
+    - list: full file path for corpus documents
+    """
+    catalog = corpusCatalog.loadCatalog(directory)
+    metadata = loadMetadata(catalog)
+
+    suffixes = input("Only these suffixes, comma separated (e.g., com,co.uk): ").strip()
+    since = input("Only policies dated on or after (YYYY-MM-DD): ").strip()
+    until = input("Only policies dated on or before (YYYY-MM-DD): ").strip()
+    maxSize = input("Largest document size in bytes: ").strip()
+
+    fileList = selectDocuments(
+        metadata,
+        suffixes=[suffix.strip() for suffix in suffixes.split(",")] if suffixes else None,
+        since=since or None,
+        until=until or None,
+        maxSize=int(maxSize) if maxSize else None
+    )
+    print(f"Selected {len(fileList):,} of {len(metadata):,} documents from the metadata index")
+
+    return fileList
+
+
+if __name__ == '__main__':
+    directory = "../privacy-policy-historical-master"
+
+    catalog = corpusCatalog.loadCatalog(directory)
+    metadata = loadMetadata(catalog)
+
+    print(f"Indexed {len(metadata):,} policies in {DEFAULT_METADATA_PATH}")
+    print(f"Header fields: {', '.join(column for column in metadata.columns if column.startswith(HEADER_PREFIX))}")
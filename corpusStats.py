@@ -0,0 +1,142 @@
+"""
+Constant-memory streaming statistics for per-document numbers (token counts,
+chunks per document). Each value updates running totals, Welford's mean and
+variance, a relative-error quantile sketch (in the style of DDSketch: log-spaced
+buckets, so every percentile is within RELATIVE_ACCURACY of a real value) and a
+power-of-two histogram. Memory depends only on the range of the values, not on
+how many documents stream by.
+"""
+
+import math
+
+# Percentiles are reported to within this relative error
+RELATIVE_ACCURACY = 0.01
+
+REPORTED_PERCENTILES = [50, 90, 99]
+
+
+def newStats(relativeAccuracy=RELATIVE_ACCURACY):
+    """
+    Creates an empty set of statistics.
+
+    Parameters:
+    - relativeAccuracy (float): Relative error of the percentile sketch.
+
+    Returns:
+    - dict: The statistics, update them with updateStats.
+    """
+    return {
+        "count": 0,
+        "total": 0,
+        "min": None,
+        "max": None,
+        "mean": 0.0,
+        "m2": 0.0,  # Sum of squared differences from the mean (Welford)
+        "gamma": (1 + relativeAccuracy) / (1 - relativeAccuracy),
+        "sketch": {},  # Log bucket index -> count, for values > 0
+        "zeroCount": 0,
+        "histogram": {},  # Power of two bucket -> count, see histogramBucket
+    }
+
+
+def updateStats(stats, value):
+    """
+    Adds one value.
+
+    Parameters:
+    - stats (dict): Statistics from newStats.
+    - value (int): A non-negative value e.g., a document's token count.
+    """
+    stats["count"] += 1
+    stats["total"] += value
+    stats["min"] = value if stats["min"] is None else min(stats["min"], value)
+    stats["max"] = value if stats["max"] is None else max(stats["max"], value)
+
+    delta = value - stats["mean"]
+    stats["mean"] += delta / stats["count"]
+    stats["m2"] += delta * (value - stats["mean"])
+
+    if value > 0:
+        bucket = math.ceil(math.log(value, stats["gamma"]))
+        stats["sketch"][bucket] = stats["sketch"].get(bucket, 0) + 1
+    else:
+        stats["zeroCount"] += 1
+
+    bucket = histogramBucket(value)
+    stats["histogram"][bucket] = stats["histogram"].get(bucket, 0) + 1
+
+
+def histogramBucket(value):
+    """
+    Lower bound of a value's log-scale histogram bucket: 0, 1, 2, 4, 8, ...
+    """
+    return 0 if value < 1 else 1 << (int(value).bit_length() - 1)
+
+
+def variance(stats):
+    """
+    Sample variance of the values so far.
+    """
+    return stats["m2"] / (stats["count"] - 1) if stats["count"] > 1 else 0.0
+
+
+def percentile(stats, q):
+    """
+    Approximate percentile from the sketch.
+
+    Parameters:
+    - stats (dict): Statistics from newStats.
+    - q (float): Percentile between 0 and 100.
+
+    Returns:
+    - float or None: The value, or None if there are no values yet.
+    """
+    if not stats["count"]:
+        return None
+
+    rank = q / 100 * (stats["count"] - 1)
+    seen = stats["zeroCount"]
+    if rank < seen:
+        return 0.0
+
+    gamma = stats["gamma"]
+    for bucket in sorted(stats["sketch"]):
+        seen += stats["sketch"][bucket]
+        if rank < seen:
+            # Middle of the bucket (gamma^(i-1), gamma^i] in relative terms
+            value = 2 * gamma ** bucket / (gamma + 1)
+            return min(max(value, stats["min"]), stats["max"])
+
+    return float(stats["max"])
+
+
+def formatStats(stats, label):
+    """
+    Formats a summary of the statistics for the terminal.
+
+    Parameters:
+    - stats (dict): Statistics from newStats.
+    - label (str): What the values are e.g., "Tokens per document".
+
+    Returns:
+    - str: The summary, one item per line.
+    """
+    if not stats["count"]:
+        return f"{label}: no documents"
+
+    percentiles = ", ".join(f"p{q} {percentile(stats, q):,.0f}" for q in REPORTED_PERCENTILES)
+    lines = [
+        f"{label}:",
+        f"  count {stats['count']:,}, total {stats['total']:,}, min {stats['min']:,}, max {stats['max']:,}",
+        f"  mean {stats['mean']:,.1f}, std dev {math.sqrt(variance(stats)):,.1f}",
+        f"  {percentiles}",
+        "  histogram:",
+    ]
+
+    largest = max(stats["histogram"].values())
+    for bucket in sorted(stats["histogram"]):
+        upper = 0 if bucket == 0 else 2 * bucket - 1
+        bar = "#" * max(1, round(40 * stats["histogram"][bucket] / largest))
+        lines.append(f"    {bucket:>10,} - {upper:<10,} {stats['histogram'][bucket]:>9,} {bar}")
+
+    return "\n".join(lines)
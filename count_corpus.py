@@ -1,16 +1,22 @@
 """
 Counts the number of tokens in the corpus 
-There are three modes of input 
+There are four modes of input 
     - manually typing the paths into a python list; you edit function inputFromList
     - Getting the intersection between the Tranco top N and the corpus 
     - Reading in from a CSV that has the full file paths
+    - Filtering the corpus metadata index (see corpusMetadata.py)
 J. Chanenson
 8/10
 """
 
-import csv, os, tiktoken, re
+import csv, math, os, tiktoken
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
-import gatherPopularSites
+import pandas as pd
+
+import corpusMetadata, corpusStats, gatherPopularSites, lookupDaemon, textCache, tokenCountCache, tokenEstimate
+from markdownStrip import stripMarkdown
 
 
 # Uncomment below if you need to download punkt
@@ -19,7 +25,36 @@ import gatherPopularSites
 
 ## Globals
 # Tokenizer, make it global so it only loads in once
-encoding = tiktoken.get_encoding("cl100k_base")
+# Loaded on first use so runs served by lookupDaemon never pay for it
+encoding = None
+
+# Documents are tokenized in batches of up to this many characters of plaintext,
+# spread over TOKEN_THREADS threads (tiktoken releases the GIL while encoding)
+TOKEN_BATCH_CHARS = 4_000_000
+TOKEN_THREADS = os.cpu_count() or 1
+
+# Set to a number of processes to read, strip and count the files on a process pool
+# instead (e.g., for a full-corpus run); None counts in this process
+PROCESS_WORKERS = None
+
+# Set to a path (e.g., 'corpusTokenCount.parquet') to also write a Parquet table of the counts
+PARQUET_OUTPUT = None
+
+# Set to a number of documents to estimate the total from a random sample of that
+# size instead of counting everything (only file sizes are read for the rest)
+ESTIMATE_SAMPLE_SIZE = None
+
+# Set to True to print the distribution of tokens and chunks per document (see corpusStats.py)
+SHOW_STATS = False
+
+# Chunk size used by convert_corpus, for the chunks per document statistics
+CHUNK_TOKENS = 1000
+
+# Dollars per 1,000 tokens
+COST_PER_1K_TOKENS = .12
+
+# One counted document
+FileCount = namedtuple("FileCount", ["path", "tokenCount", "size", "contentHash"])
 
 
 def inputFromList():
@@ -103,6 +138,7 @@ def dataInput():
     print("1. Input from User List")
     print("2. Input from Tranco")
     print("3. Input from CSV")
+    print("4. Input from Metadata Index")
     
     choice = int(input("Choice: "))
 
@@ -115,148 +151,414 @@ def dataInput():
         # fileName = input("Enter the CSV filename (with extension): ")
         fileName = "process_application_data\Corpus_Subset_Selection_Checked.csv"
         fileList = inputFromCSV(fileName)
+    elif choice == 4:
+        fileList = corpusMetadata.inputFromMetadata()
     else:
         print("Invalid choice!")
     
     return fileList
 
 
-def main():
+def main(processWorkers=PROCESS_WORKERS, parquetPath=PARQUET_OUTPUT, estimateSampleSize=ESTIMATE_SAMPLE_SIZE, showStats=SHOW_STATS):
     # Set up output CSV file
     # Set the outputPath to the same directory as the script
     scriptDir = os.path.dirname(os.path.abspath(__file__))
     outputPath = os.path.join(scriptDir, 'corpusTokenCount.csv')
-    checkCSVFile(outputPath)
     
-    # Get data from one of three sources w/terminal input
+    # Get data from one of four sources w/terminal input: the user list, Tranco, a CSV or the metadata index
     fileList = dataInput()
 
+    # Stripped plaintext is cached by content hash, so unchanged documents skip stripMarkdown,
+    # and token counts are cached per file, so documents counted by an earlier run aren't even read
+    cache = textCache.openCache()
+    tokenCache = tokenCountCache.openTokenCache()
+
+    if estimateSampleSize:
+        print(f"\nRead in {len(fileList):,} documents. Estimating tokens from a sample...")
+        try:
+            estimateTokens(fileList, estimateSampleSize, cache, tokenCache, processWorkers)
+        finally:
+            tokenCountCache.closeTokenCache(tokenCache)
+            textCache.closeCache(cache)
+        return
+
     print(f"\nRead in {len(fileList):,} documents. Counting tokens...")
     
     totalTokensForAllFiles = 0
 
-    for inputPath in fileList:
-        fileContent = readFile(inputPath)
-        
-        plainText = stripMarkdown(fileContent)
-        
-        tokenCount = countTokens(plainText)
+    # Streaming distribution of the counts, constant memory however many documents there are
+    tokenStats = corpusStats.newStats()
+    chunkStats = corpusStats.newStats()
 
-        writeToCSV(outputPath, os.path.basename(inputPath), tokenCount)
-        
-        totalTokensForAllFiles += tokenCount
+    # A file that fails is reported at the end instead of stopping the run
+    errors = []
+
+    writer = openCountWriter(outputPath, parquetPath)
+
+    # Even if the run is interrupted, keep the rows and cache entries made so far
+    try:
+        for inputPath, fileCount, error in countFiles(fileList, cache, processWorkers, tokenCache):
+            if error is not None:
+                errors.append((inputPath, error))
+                continue
+
+            # The total and stats cover the same documents as the CSV rows: a file name listed twice counts once
+            if not writeCount(writer, fileCount):
+                continue
+
+            totalTokensForAllFiles += fileCount.tokenCount
+
+            corpusStats.updateStats(tokenStats, fileCount.tokenCount)
+            # Fewest CHUNK_TOKENS chunks the document can be split into
+            corpusStats.updateStats(chunkStats, math.ceil(fileCount.tokenCount / CHUNK_TOKENS))
+
+            # print(f"Token count for {os.path.basename(fileCount.path)} saved to {outputPath}.")
+    finally:
+        closeCountWriter(writer)
+        tokenCountCache.closeTokenCache(tokenCache)
+        textCache.closeCache(cache)
+
+    print(f"Token count cache: {tokenCache['hits']:,} hits, {tokenCache['misses']:,} misses")
+    print(f"Text cache: {cache['hits']:,} hits, {cache['misses']:,} misses")
 
-        # print(f"Token count for {os.path.basename(inputPath)} saved to {outputPath}.")
+    print(f"Counted {len(fileList) - len(errors):,} of {len(fileList):,} files")
+    for inputPath, error in errors:
+        print(f"  Failed: {inputPath}: {type(error).__name__}: {error}")
 
     print(f"Total tokens for all processed files: {totalTokensForAllFiles:,}")
-    print(f"Total cost for all processed files: ${(totalTokensForAllFiles/1000)*.12:.2f}")
+    print(f"Total cost for all processed files: ${(totalTokensForAllFiles/1000)*COST_PER_1K_TOKENS:.2f}")
 
+    if showStats:
+        print(corpusStats.formatStats(tokenStats, "Tokens per document"))
+        print(corpusStats.formatStats(chunkStats, f"Chunks per document (at {CHUNK_TOKENS:,} tokens)"))
 
-def checkCSVFile(outputPath):
+def estimateTokens(fileList, sampleSize, cache, tokenCache=None, processWorkers=None):
     """
-    Checks to see if the CSV file exists.
-    If not, write the header.
+    Prints an estimate of the total tokens and cost, with a 95% confidence interval,
+    from an exact count of a size-stratified random sample (see tokenEstimate.py).
 
     Parameters:
-    - outputPath (str): Path to the csv file
-    
+    - fileList (list): Paths of the documents.
+    - sampleSize (int): Roughly how many documents to count exactly.
+    - cache (dict): Text cache from textCache.openCache.
+    - tokenCache (dict): Optional token count cache.
+    - processWorkers (int): Count the sample on this many processes.
+
     Returns:
-    - None
+    - dict: The estimate from tokenEstimate.estimateTotalTokens.
     """
-    if not os.path.exists(outputPath):
-        with open(outputPath, 'w', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(["File Name", "Token Count"])
-    
-    return None
+    def countSample(paths):
+        counts = []
+        for _, fileCount, error in countFiles(paths, cache, processWorkers, tokenCache):
+            # The estimate needs every sampled count
+            if error is not None:
+                raise error
+            counts.append(fileCount.tokenCount)
+        return counts
+
+    estimate = tokenEstimate.estimateTotalTokens(fileList, countSample, sampleSize)
+
+    print(f"Counted a sample of {estimate['sampleSize']:,} documents ({estimate['bytesPerToken']:.2f} bytes per token)")
+    print(f"Estimated total tokens: {estimate['total']:,.0f} (95% CI {estimate['low']:,.0f} to {estimate['high']:,.0f})")
+    print(f"Estimated total cost: ${(estimate['total']/1000)*COST_PER_1K_TOKENS:.2f} "
+          f"(95% CI ${(estimate['low']/1000)*COST_PER_1K_TOKENS:.2f} to ${(estimate['high']/1000)*COST_PER_1K_TOKENS:.2f})")
+
+    return estimate
 
-def readFile(filePath):
+
+def countTokens(plainText):
     """
-    Reads the content of a file.
-    
+    Counts the tokens in a given plaintext string. 
+    Using the GPT-3 token counter because its fast. 
+
     Parameters:
-    - filePath (str): Path to the file to be read.
+    - plainText (str): Plaintext content.
 
     Returns:
-    - str: Content of the file.
+    - int: Number of tokens in the content.
     """
-    with open(filePath, 'r', encoding='utf-8') as file:
-        return file.read()
+    if lookupDaemon.daemonHasTokenizer():
+        counts = lookupDaemon.daemonCountTokens([plainText])
+        if counts is not None:
+            return counts[0]
 
-def stripMarkdown(markdownContent):
+    return len(getEncoding().encode(plainText))
+
+def countFiles(fileList, cache, processWorkers=None, tokenCache=None):
     """
-    Strips common Markdown elements from a given string containing Markdown content.
+    Counts the tokens in every file, either in batches in this process or on a process pool.
 
     Parameters:
-    - markdownContent (str): The content string with Markdown formatting.
+    - fileList (list): Paths of the documents.
+    - cache (dict): Text cache from textCache.openCache (not used by the process pool).
+    - processWorkers (int): Number of worker processes, None to count in this process.
+    - tokenCache (dict): Optional token count cache from tokenCountCache.openTokenCache.
+      Files it already knows (by path, size and mtime) aren't read at all, and
+      every newly counted file is added to it.
 
     Returns:
-    - str: The content with Markdown elements removed.
+    - generator: (path, FileCount, None) for each counted file, or (path, None, exception)
+      if it couldn't be read, in input order.
     """
-    
-    content = markdownContent
+    cachedCounts = {}
+    if tokenCache is not None:
+        for inputPath in fileList:
+            try:
+                cached = tokenCountCache.lookupFile(tokenCache, inputPath)
+            except OSError:
+                # Reported when the file is read below
+                cached = None
+            if cached is not None:
+                cachedCounts[inputPath] = FileCount(inputPath, *cached)
+
+    toCount = [inputPath for inputPath in fileList if inputPath not in cachedCounts]
+    if processWorkers:
+        counted = countFilesInPool(toCount, processWorkers)
+        if tokenCache is not None:
+            tokenCache["misses"] += len(toCount)
+    else:
+        counted = countFilesInBatches(toCount, cache, tokenCache)
+
+    for inputPath in fileList:
+        fileCount, error = cachedCounts.get(inputPath), None
+        if fileCount is None:
+            _, fileCount, error = next(counted)
+            if error is None and tokenCache is not None:
+                tokenCountCache.storeCount(tokenCache, inputPath, fileCount.size, fileCount.contentHash, fileCount.tokenCount)
+        yield inputPath, fileCount, error
+
+def countFilesInBatches(fileList, cache, tokenCache=None):
+    """
+    Counts the tokens in every file in this process, in batches (see textBatches).
+
+    Parameters:
+    - fileList (list): Paths of the documents.
+    - cache (dict): Text cache from textCache.openCache.
+    - tokenCache (dict): Optional token count cache; documents it has seen
+      under another path or mtime are looked up by content hash instead of encoded.
 
-    ### REMOVE THE BLOCK QUOTE AT THE TOP OF THE FILE ##
-    # This will match everything starting from the first block quote to the newline just before the first top-level heading.
-    pattern = r'^(?:>.*\n)+\n(?=# )'
+    Returns:
+    - generator: (path, FileCount, None) or (path, None, exception) tuples, in input order.
+    """
+    for batch in textBatches(fileList, cache):
+        tokenCounts = [None] * len(batch)
+        if tokenCache is not None:
+            tokenCounts = [tokenCountCache.lookupContent(tokenCache, contentHash) if error is None else None
+                           for _, contentHash, _, _, error in batch]
+
+        toEncode = [i for i, tokenCount in enumerate(tokenCounts) if tokenCount is None and batch[i][4] is None]
+        if toEncode:
+            encodedCounts = countTokensBatch([batch[i][3] for i in toEncode])
+            for i, tokenCount in zip(toEncode, encodedCounts):
+                tokenCounts[i] = tokenCount
+
+        for (inputPath, contentHash, size, _, error), tokenCount in zip(batch, tokenCounts):
+            if error is not None:
+                yield inputPath, None, error
+            else:
+                yield inputPath, FileCount(inputPath, tokenCount, size, contentHash), None
 
-    # Replace the matched block quote with an empty string
-    content = re.sub(pattern, '', content, flags=re.MULTILINE)
+def countFilesInPool(fileList, processWorkers):
+    """
+    Reads, strips and counts files on a process pool. Each worker loads the
+    tokenizer once when it starts. Files are handed out largest first so one big
+    document doesn't hold up the end of the run, and the counts are handed back
+    in input order as soon as each one (and everything before it) is done.
+
+    Parameters:
+    - fileList (list): Paths of the documents.
+    - processWorkers (int): Number of worker processes.
+
+    Returns:
+    - generator: (path, FileCount, None) or (path, None, exception) tuples, in input order.
+    """
+    largestFirst = sorted(range(len(fileList)), key=lambda i: _fileSize(fileList[i]), reverse=True)
+
+    executor = ProcessPoolExecutor(max_workers=processWorkers, initializer=_initCountWorker)
+    try:
+        futures = [None] * len(fileList)
+        for i in largestFirst:
+            futures[i] = executor.submit(_countFileInWorker, fileList[i])
+
+        for inputPath, future in zip(fileList, futures):
+            try:
+                yield inputPath, future.result(), None
+            except Exception as error:
+                yield inputPath, None, error
+    finally:
+        # If the caller stops early, drop the files that haven't started yet
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _fileSize(path):
+    """
+    Size of a file for scheduling, 0 if it can't be read (the error is reported when it's counted).
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
 
-    # Links: ![alt_text](url) or [link_text](url)
-    content = re.sub(r'!\[.*?\]\(.*?\)', '', content)  # Images
-    content = re.sub(r'\[.*?\]\(.*?\)', '', content)   # Links
+def _initCountWorker():
+    """
+    Process pool initializer: loads the tokenizer once per worker.
+    """
+    getEncoding()
 
-    # Headers: # or ## or ### etc.
-    content = re.sub(r'#+', '', content)
+def _countFileInWorker(inputPath):
+    """
+    Reads, strips and counts one file. Runs in a countFilesInPool worker.
+    """
+    contentHash, size, fileContent = textCache.readSource(inputPath)
+    return FileCount(inputPath, len(getEncoding().encode(stripMarkdown(fileContent))), size, contentHash)
 
-    # Emphasis: *italic* or **bold** or ***bolditalic***
-    content = re.sub(r'\*+', '', content)
+def textBatches(fileList, cache, maxChars=TOKEN_BATCH_CHARS):
+    """
+    Reads and strips documents in order, grouping them into batches for countTokensBatch.
+    A document longer than maxChars gets a batch to itself.
 
-    ## Jake: leaving this in because we finetuned on lists
-    # Lists: - item or * item or + item
-    # content = re.sub(r'^[-\*+]\s+', '', content, flags=re.M)
+    Parameters:
+    - fileList (list): Paths of the documents.
+    - cache (dict): Text cache from textCache.openCache.
+    - maxChars (int): Most plaintext characters per batch.
 
-    # Inline Code: `code`
-    content = re.sub(r'`', '', content)
+    Returns:
+    - generator: Lists of (path, content hash, size, plaintext, None) tuples, in input order.
+      A file that can't be read or decoded is (path, None, None, None, exception) instead.
+    """
+    batch = []
+    batchChars = 0
 
-    # Blockquotes: > quote
-    content = re.sub(r'^>\s+', '', content, flags=re.M)
+    for inputPath in fileList:
+        try:
+            contentHash, size, plainText = textCache.getPlaintextEntry(cache, inputPath)
+        except (OSError, UnicodeDecodeError) as error:
+            batch.append((inputPath, None, None, None, error))
+            continue
 
-    # Horizontal lines: --- or *** or - - -
-    content = re.sub(r'^[\-_*]\s*[\-_*]\s*[\-_*]\s*$', '', content, flags=re.M)
+        if batch and batchChars + len(plainText) > maxChars:
+            yield batch
+            batch = []
+            batchChars = 0
 
-    # Code blocks: ```code```
-    content = re.sub(r'```.*?```', '', content, flags=re.S)
+        batch.append((inputPath, contentHash, size, plainText, None))
+        batchChars += len(plainText)
 
-    return content
+    if batch:
+        yield batch
 
-def countTokens(plainText):
+def countTokensBatch(plainTexts, numThreads=TOKEN_THREADS):
     """
-    Counts the tokens in a given plaintext string. 
-    Using the GPT-3 token counter because its fast. 
+    Counts the tokens in a batch of plaintext strings on several threads.
+    Gives the same counts as calling countTokens on each one.
 
     Parameters:
-    - plainText (str): Plaintext content.
+    - plainTexts (list): Plaintext contents.
+    - numThreads (int): Number of encoding threads.
 
     Returns:
-    - int: Number of tokens in the content.
+    - list: Number of tokens in each content, in order.
     """
-    return len(encoding.encode(plainText)) 
+    if lookupDaemon.daemonHasTokenizer():
+        counts = lookupDaemon.daemonCountTokens(plainTexts)
+        if counts is not None:
+            return counts
 
-def writeToCSV(outputPath, fileName, tokenCount):
+    return [len(tokens) for tokens in getEncoding().encode_batch(plainTexts, num_threads=numThreads)]
+
+def getEncoding():
+    """
+    Returns the cl100k_base tokenizer, loading it on the first call.
     """
-    Writes the file name and token count to a CSV file, and keeps track of the total tokens.
+    global encoding
+    if encoding is None:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return encoding
+
+def openCountWriter(outputPath, parquetPath=None):
+    """
+    Opens the token count output for a run. Rows are streamed through a
+    buffered file next to outputPath; closeCountWriter then carries over the
+    rows from earlier runs that this run didn't recount and swaps the file in,
+    so re-running never duplicates a document's row.
 
     Parameters:
     - outputPath (str): Path to the output CSV file.
-    - fileName (str): Name of the processed file.
-    - tokenCount (int): Token count for the processed file.
+    - parquetPath (str): Optional path of a Parquet table with path, file name,
+      token count, byte size and content hash for every document.
+
+    Returns:
+    - dict: The writer, pass it to writeCount and closeCountWriter.
+    """
+    tempPath = outputPath + ".tmp"
+    csvfile = open(tempPath, 'w', newline='', buffering=1 << 20)
+    csvwriter = csv.writer(csvfile)
+    csvwriter.writerow(["File Name", "Token Count"])
+
+    return {
+        "outputPath": outputPath,
+        "tempPath": tempPath,
+        "csvfile": csvfile,
+        "csvwriter": csvwriter,
+        "fileNames": set(),
+        "parquetPath": parquetPath,
+        "rows": [] if parquetPath else None,
+    }
+
+def writeCount(writer, fileCount):
+    """
+    Writes one document's token count. A document listed twice in one run
+    (the same file name) gets one row.
+
+    Parameters:
+    - writer (dict): Writer from openCountWriter.
+    - fileCount (FileCount): The counted document.
+
+    Returns:
+    - bool: False if the document already had a row in this run and was skipped.
     """
+    fileName = os.path.basename(fileCount.path)
+    if fileName in writer["fileNames"]:
+        return False
+
+    writer["csvwriter"].writerow([fileName, fileCount.tokenCount])
+    writer["fileNames"].add(fileName)
+
+    if writer["rows"] is not None:
+        writer["rows"].append((fileCount.path, fileName, fileCount.tokenCount, fileCount.size, fileCount.contentHash))
 
-    with open(outputPath, 'a', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow([fileName, tokenCount])
+    return True
+
+def closeCountWriter(writer):
+    """
+    Finishes the output: earlier rows for documents this run didn't count are
+    kept (after this run's rows, and only the latest row for each document if an
+    older version of this script appended duplicates), then the new file
+    replaces the old one. Documents are matched by file name in both the CSV
+    and the Parquet table.
+
+    Parameters:
+    - writer (dict): Writer from openCountWriter.
+    """
+    outputPath = writer["outputPath"]
+
+    if os.path.exists(outputPath):
+        with open(outputPath, 'r', newline='') as oldfile:
+            oldRows = csv.reader(oldfile)
+            next(oldRows, None)  # Header
+            keptRows = {row[0]: row for row in oldRows if row and row[0] not in writer["fileNames"]}
+        writer["csvwriter"].writerows(keptRows.values())
+
+    writer["csvfile"].close()
+    os.replace(writer["tempPath"], outputPath)
+
+    if writer["rows"] is not None:
+        table = pd.DataFrame(writer["rows"], columns=["path", "fileName", "tokenCount", "size", "contentHash"])
+        parquetPath = writer["parquetPath"]
+        if os.path.exists(parquetPath):
+            oldTable = pd.read_parquet(parquetPath)
+            # Same key as the CSV, which only records file names
+            table = pd.concat([table, oldTable[~oldTable["fileName"].isin(table["fileName"])]], ignore_index=True)
+        table.to_parquet(parquetPath, index=False)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,302 @@
+"""
+Read-only, memory-mapped domain index of the privacy policy corpus.
+The catalog's path/domain/suffix data is written out once as flat arrays:
+sorted string tables for domains and suffixes, each with an offset array and
+the ids of the policies under every key. Queries binary search the mapped
+file directly, so nothing is deserialized and every process that opens the
+index (e.g., multiprocessing workers) shares one page-cache copy of it
+instead of building its own dict of the corpus.
+
+Supports exact domain, domain prefix and suffix (TLD) queries. Arrays are
+stored in the machine's native byte order, so build the index where it's used.
+"""
+
+import mmap, os, struct
+from array import array
+
+import corpusCatalog, corpusLookup, domainParser
+
+# Index lives next to the catalog by default
+DEFAULT_INDEX_PATH = ".corpus_domains.idx"
+
+MAGIC = b"PLPCDIX1"
+
+# Sections in file order, with the array typecode used for each
+# Offsets/starts arrays have one more entry than the table they index
+_SECTIONS = [
+    ("pathOffsets", "Q"),    # Record id -> start of its path in pathBlob
+    ("pathBlob", "B"),       # UTF-8 paths in catalog order
+    ("recordFlags", "B"),    # Record id -> _HAS_SUBDOMAIN | _IS_COM
+    ("domainOffsets", "Q"),  # Key number -> start of the domain in domainBlob
+    ("domainBlob", "B"),     # Unique domains, sorted
+    ("domainStarts", "Q"),   # Key number -> first entry in domainRecords
+    ("domainRecords", "I"),  # Record ids grouped by domain, catalog order within a domain
+    ("suffixOffsets", "Q"),
+    ("suffixBlob", "B"),
+    ("suffixStarts", "Q"),
+    ("suffixRecords", "I"),
+]
+_HEADER = struct.Struct("=" + "Q" * (1 + 2 * len(_SECTIONS)))
+
+_HAS_SUBDOMAIN = 1
+_IS_COM = 2
+
+# Greater than any byte in UTF-8 text, so prefix + _AFTER_PREFIX bounds a prefix range
+_AFTER_PREFIX = b"\xff"
+
+
+def buildDomainIndex(catalog, indexPath=DEFAULT_INDEX_PATH):
+    """
+    Writes the index for every policy in the catalog.
+    The file is written next to indexPath and then moved into place, so
+    processes that already have the old index open keep a consistent view.
+
+    Parameters:
+    - catalog (sqlite3.Connection): Catalog from corpusCatalog.loadCatalog.
+    - indexPath (str): Where to write the index.
+
+    Returns:
+    - int: Number of policies in the index.
+    """
+    rows = catalog.execute("SELECT path, subdomain, domain, suffix FROM policies ORDER BY id").fetchall()
+
+    pathBlob = bytearray()
+    pathOffsets = array("Q", [0])
+    recordFlags = bytearray()
+    domainIds = {}
+    suffixIds = {}
+
+    for recordId, (path, subdomain, domain, suffix) in enumerate(rows):
+        pathBlob += path.encode('utf-8')
+        pathOffsets.append(len(pathBlob))
+        recordFlags.append((_HAS_SUBDOMAIN if subdomain else 0) | (_IS_COM if suffix == "com" else 0))
+        domainIds.setdefault(domain, []).append(recordId)
+        suffixIds.setdefault(suffix, []).append(recordId)
+
+    sections = {"pathOffsets": pathOffsets, "pathBlob": pathBlob, "recordFlags": recordFlags}
+    sections.update(_stringTable("domain", domainIds))
+    sections.update(_stringTable("suffix", suffixIds))
+
+    # Lay the sections out 8-byte aligned after the header
+    layout = []
+    data = bytearray()
+    for name, _ in _SECTIONS:
+        data += b"\0" * (-(len(MAGIC) + _HEADER.size + len(data)) % 8)
+        raw = bytes(sections[name])
+        layout += [len(MAGIC) + _HEADER.size + len(data), len(raw)]
+        data += raw
+
+    tempPath = indexPath + ".tmp"
+    with open(tempPath, 'wb') as file:
+        file.write(MAGIC)
+        file.write(_HEADER.pack(len(rows), *layout))
+        file.write(data)
+    os.replace(tempPath, indexPath)
+
+    return len(rows)
+
+
+def _stringTable(name, recordIds):
+    """
+    Builds the sorted string table sections for one key column.
+    Keys are sorted by their UTF-8 bytes, which is the order the lookups compare in.
+
+    Parameters:
+    - name (str): "domain" or "suffix".
+    - recordIds (dict): Key -> list of record ids.
+
+    Returns:
+    - dict: Section name -> array.
+    """
+    blob = bytearray()
+    offsets = array("Q", [0])
+    starts = array("Q", [0])
+    records = array("I")
+
+    for key, ids in sorted((key.encode('utf-8'), ids) for key, ids in recordIds.items()):
+        blob += key
+        offsets.append(len(blob))
+        records.extend(ids)
+        starts.append(len(records))
+
+    return {f"{name}Offsets": offsets, f"{name}Blob": blob, f"{name}Starts": starts, f"{name}Records": records}
+
+
+def loadDomainIndex(indexPath=DEFAULT_INDEX_PATH):
+    """
+    Memory-maps an index written by buildDomainIndex. Cheap enough to call in
+    every worker process (e.g., from a multiprocessing Pool initializer).
+
+    Parameters:
+    - indexPath (str): Location of the index.
+
+    Returns:
+    - dict: The mapped index, a memoryview per section plus "mmap" and "numRecords".
+    """
+    with open(indexPath, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:len(MAGIC)] != MAGIC:
+        mapped.close()
+        raise ValueError(f"{indexPath} is not a domain index")
+
+    numRecords, *layout = _HEADER.unpack_from(mapped, len(MAGIC))
+    view = memoryview(mapped)
+
+    index = {"mmap": mapped, "numRecords": numRecords}
+    for i, (name, typecode) in enumerate(_SECTIONS):
+        start, length = layout[2 * i], layout[2 * i + 1]
+        index[name] = view[start:start + length].cast(typecode)
+
+    return index
+
+
+def closeDomainIndex(index):
+    """
+    Releases the views and unmaps the index.
+    """
+    for name, _ in _SECTIONS:
+        index[name].release()
+    index["mmap"].close()
+
+
+def _keyRange(index, table, key, prefix=False):
+    """
+    Binary searches a sorted string table.
+
+    Parameters:
+    - index (dict): Index from loadDomainIndex.
+    - table (str): "domain" or "suffix".
+    - key (str): Key to look up.
+    - prefix (bool): Match every key that starts with key instead of key itself.
+
+    Returns:
+    - tuple: (first, last) key numbers, last exclusive.
+    """
+    offsets = index[f"{table}Offsets"]
+    blob = index[f"{table}Blob"]
+    key = key.encode('utf-8')
+
+    def lowerBound(target):
+        low, high = 0, len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if blob[offsets[middle]:offsets[middle + 1]].tobytes() < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    first = lowerBound(key)
+    last = lowerBound(key + _AFTER_PREFIX) if prefix else lowerBound(key + b"\0")
+    return first, last
+
+
+def _recordIds(index, table, key, prefix=False):
+    """
+    Returns the record ids under a key (or key prefix), as a memoryview slice.
+    """
+    first, last = _keyRange(index, table, key, prefix)
+    starts = index[f"{table}Starts"]
+    return index[f"{table}Records"][starts[first]:starts[last]]
+
+
+def _path(index, recordId):
+    """
+    Decodes the path of one record.
+    """
+    offsets = index["pathOffsets"]
+    return index["pathBlob"][offsets[recordId]:offsets[recordId + 1]].tobytes().decode('utf-8')
+
+
+def indexExactMatchTLD(index, website, bareCom=True):
+    """
+    Index version of findExactMatchInDirTLD: returns a single policy that
+    exactly matches the website's domain, prioritizing .com.
+
+    Parameters:
+    - index (dict): Index from loadDomainIndex.
+    - website (str): The website URL or name to use for matching.
+    - bareCom (bool): When true a .com only wins if it has no subdomain
+      (gatherPopularSites' rule); checkSheetItems accepts any .com.
+
+    Returns:
+    - str or None: Returns the file path if a match is found, or None otherwise.
+    """
+    recordIds = _recordIds(index, "domain", corpusLookup.websiteDomain(website))
+    if not recordIds:
+        return None
+
+    flags = index["recordFlags"]
+    for recordId in recordIds:
+        if flags[recordId] & _IS_COM and not (bareCom and flags[recordId] & _HAS_SUBDOMAIN):
+            return _path(index, recordId)
+
+    return _path(index, recordIds[0])
+
+
+def indexExactMatches(index, websites, limit=5):
+    """
+    Index version of findMatchingFiles(..., exact=True).
+
+    Parameters:
+    - index (dict): Index from loadDomainIndex.
+    - websites (list): A list of website URLs to use for matching.
+    - limit (int): Maximum number of matches kept per domain.
+
+    Returns:
+    - dict: Dictionary with domains as keys and lists of matching file paths as values.
+    """
+    matches = {parts.domain: [] for parts in domainParser.extractMany(websites)}
+
+    for domain in matches:
+        recordIds = _recordIds(index, "domain", domain)[:limit]
+        matches[domain] = [_path(index, recordId) for recordId in recordIds]
+
+    return matches
+
+
+def indexPrefixMatches(index, prefix, limit=None):
+    """
+    Finds policies whose domain starts with prefix e.g., "goog" matches google and googleapis.
+
+    Parameters:
+    - index (dict): Index from loadDomainIndex.
+    - prefix (str): Lowercase domain prefix.
+    - limit (int): Maximum number of paths returned, None for all.
+
+    Returns:
+    - list: Matching file paths, in catalog order.
+    """
+    recordIds = sorted(_recordIds(index, "domain", prefix, prefix=True))
+    return [_path(index, recordId) for recordId in recordIds[:limit]]
+
+
+def indexFilesByTLDs(index, gtlds):
+    """
+    Index version of findFilesByTLDs.
+
+    Parameters:
+    - index (dict): Index from loadDomainIndex.
+    - gtlds (list): List of gTLDs (like ['.com', '.org', ...]) to search for.
+
+    Returns:
+    - dict: A dictionary with gTLDs as keys and lists of matching file paths as values.
+    """
+    matches = {gtld: [] for gtld in gtlds}
+
+    for gtld in matches:
+        # findFilesByTLDs compares against '.' + suffix, so anything else never matches
+        if not gtld.startswith('.'):
+            continue
+        matches[gtld] = [_path(index, recordId) for recordId in _recordIds(index, "suffix", gtld[1:])]
+
+    return matches
+
+
+if __name__ == '__main__':
+    directory = "../privacy-policy-historical-master"
+
+    catalog = corpusCatalog.loadCatalog(directory)
+    numRecords = buildDomainIndex(catalog)
+    print(f"Indexed {numRecords:,} policies into {DEFAULT_INDEX_PATH} ({os.path.getsize(DEFAULT_INDEX_PATH):,} bytes)")
@@ -0,0 +1,215 @@
+"""
+Offline replacement for tldextract.extract in the corpus lookup hot loops.
+Splits a host name or URL into (subdomain, domain, suffix) using the public
+suffix list snapshot bundled with this repo (public_suffix_list.dat, pinned to
+the 2023-02-09 release), compiled once into a reversed-label trie.
+Unlike tldextract it never tries to fetch the list over the network.
+Results match tldextract.extract with its default settings (ICANN suffixes only).
+"""
+
+import os, re, socket
+from collections import namedtuple
+
+try:
+    import idna  # Installed alongside requests; same punycode decoding as tldextract
+except ImportError:
+    idna = None
+
+# Same field names as tldextract's ExtractResult so callers can use either
+DomainParts = namedtuple("DomainParts", ["subdomain", "domain", "suffix"])
+
+SUFFIX_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+PRIVATE_DOMAINS_MARKER = "// ===BEGIN PRIVATE DOMAINS==="
+
+# Trie nodes are dicts of label -> child node; this key marks the end of a rule
+_RULE_END = None
+
+# Loaded on first use
+_trie = None
+
+_schemeRe = re.compile(r"^[A-Za-z0-9+\-.]+:$")
+_urlCharsRe = re.compile(r"[/?#@\[:]")
+
+
+def loadSuffixTrie(suffixListPath=SUFFIX_LIST_PATH, includePrivate=False):
+    """
+    Reads a public suffix list file and compiles it into a reversed-label trie
+    e.g., "co.uk" is stored as uk -> co.
+
+    Parameters:
+    - suffixListPath (str): Path to a public_suffix_list.dat file.
+    - includePrivate (bool): Also load the PRIVATE DOMAINS section (github.io etc.).
+
+    Returns:
+    - dict: Root node of the trie.
+    """
+    root = {}
+
+    with open(suffixListPath, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.startswith(PRIVATE_DOMAINS_MARKER) and not includePrivate:
+                break
+
+            # Rules are the first whitespace-separated token on non-comment lines
+            rule = line.strip().split(' ')[0]
+            if not rule or rule.startswith("//"):
+                continue
+
+            node = root
+            for label in reversed(rule.split('.')):
+                node = node.setdefault(label, {})
+            node[_RULE_END] = True
+
+    return root
+
+
+def _getTrie():
+    """
+    Returns the trie for the bundled snapshot, compiling it on first use.
+    """
+    global _trie
+    if _trie is None:
+        _trie = loadSuffixTrie()
+    return _trie
+
+
+def _decodeLabel(label):
+    """
+    Lowercases a label and decodes it if it's punycode (xn--).
+    """
+    lowered = label.lower()
+    if lowered.startswith("xn--"):
+        try:
+            if idna is not None:
+                return idna.decode(lowered)
+            return lowered.encode('ascii').decode('idna')
+        except (UnicodeError, IndexError):
+            pass
+    return lowered
+
+
+def _suffixIndex(labels, trie):
+    """
+    Walks the trie from the last label backwards and returns the index of the
+    first suffix label, or len(labels) if there is no known suffix.
+    Handles wildcard (*.ck) and exception (!www.ck) rules.
+
+    Parameters:
+    - labels (list): Lowercased labels; punycode ones are decoded here.
+    - trie (dict): Root node from loadSuffixTrie.
+
+    Returns:
+    - int: Index of the first suffix label.
+    """
+    node = trie
+    i = len(labels)
+    j = i
+
+    for label in reversed(labels):
+        if label.startswith("xn--"):
+            label = _decodeLabel(label)
+
+        child = node.get(label)
+        if child is not None:
+            j -= 1
+            if _RULE_END in child:
+                i = j
+            node = child
+            continue
+
+        if "*" in node:
+            if "!" + label in node:
+                return j
+            return j - 1
+
+        break
+
+    return i
+
+
+def _lenientNetloc(url):
+    """
+    Pulls the host name out of a URL-like string without raising,
+    the same way tldextract does (drops scheme, path, user info and port).
+    """
+    # Plain host names (every corpus file name) skip the URL handling
+    if _urlCharsRe.search(url) is None:
+        return url.strip().rstrip(".。．｡")
+
+    doubleSlash = url.find("//")
+    if doubleSlash == 0:
+        url = url[2:]
+    elif doubleSlash >= 2 and _schemeRe.match(url[:doubleSlash]):
+        url = url[doubleSlash + 2:]
+
+    afterUserInfo = url.partition("/")[0].partition("?")[0].partition("#")[0].rpartition("@")[-1]
+
+    if afterUserInfo and afterUserInfo[0] == "[":
+        maybeIPv6 = afterUserInfo.partition("]")
+        if maybeIPv6[1] == "]":
+            return f"{maybeIPv6[0]}]"
+
+    hostName = afterUserInfo.partition(":")[0].strip()
+    return hostName.rstrip(".。．｡")
+
+
+def _looksLikeIP(address, family):
+    """
+    True if address parses as an IP address of the given socket family.
+    """
+    try:
+        socket.inet_pton(family, address)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def _splitNetloc(netloc, trie):
+    """
+    Splits a bare host name into DomainParts.
+    """
+    if not netloc.isascii():
+        netloc = netloc.replace("。", ".").replace("．", ".").replace("｡", ".")
+
+    if netloc[:1] == "[" and len(netloc) >= 4 and netloc[-1] == "]":
+        if _looksLikeIP(netloc[1:-1], socket.AF_INET6):
+            return DomainParts("", netloc, "")
+
+    labels = netloc.split(".")
+    suffixIndex = _suffixIndex(netloc.lower().split("."), trie)
+
+    if suffixIndex == len(labels) == 4 and netloc[0].isdigit() and _looksLikeIP(netloc, socket.AF_INET):
+        return DomainParts("", netloc, "")
+
+    suffix = ".".join(labels[suffixIndex:])
+    subdomain = ".".join(labels[:suffixIndex - 1]) if suffixIndex >= 2 else ""
+    domain = labels[suffixIndex - 1] if suffixIndex else ""
+    return DomainParts(subdomain, domain, suffix)
+
+
+def extract(url):
+    """
+    Drop-in for tldextract.extract: splits a URL or host name into its parts.
+
+    Parameters:
+    - url (str): e.g., "http://forums.bbc.co.uk/" or "geappliances.com"
+
+    Returns:
+    - DomainParts: e.g., DomainParts(subdomain='forums', domain='bbc', suffix='co.uk')
+    """
+    return _splitNetloc(_lenientNetloc(url), _getTrie())
+
+
+def extractMany(urls):
+    """
+    Batch version of extract for hot loops e.g., every file name in a corpus
+    directory. The trie is looked up once for the whole batch.
+
+    Parameters:
+    - urls (iterable): URLs or host names.
+
+    Returns:
+    - list: DomainParts for each input, in order.
+    """
+    trie = _getTrie()
+    return [_splitNetloc(_lenientNetloc(url), trie) for url in urls]
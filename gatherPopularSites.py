@@ -6,15 +6,24 @@ J. Chanenson
 """
 
 from tranco import Tranco
-import os, tldextract
+import os
+import pandas as pd
 from tqdm import tqdm
 
-def findTopSites(numSites, searchType = "exact"):
+import ahoCorasick, corpusCatalog, corpusLookup, domainIndex, domainParser, lookupDaemon
+
+def findTopSites(numSites, searchType = "exact", catalog=None, shard=False, workers=None, trancoCSV=None, index=None):
     """
     Gets the top sites from tranco and then looks for them in a given directory 
     Options for kwarg: "fuzzy", "exact", "exact-TLD:com"
     Parameters:
     - numSites (int): the top N sites 
+    - catalog (sqlite3.Connection): Optional corpus catalog (see corpusCatalog.py),
+      when given every lookup is an indexed query instead of a full-tree walk
+    - shard (bool): For "exact-TLD:com", probe each site's shard directory instead of walking the tree
+    - workers (int): List the corpus on this many threads (see corpusLookup.walkCorpus)
+    - trancoCSV (str): Optional local Tranco snapshot (rank,domain CSV) used instead of the live service
+    - index (dict): Optional memory-mapped domain index (see domainIndex.py), used for the exact searches
     
     Returns:
     - file paths for the matching sites
@@ -33,29 +42,41 @@ def findTopSites(numSites, searchType = "exact"):
         raise ValueError(f"Invalid searchType. Expected one of {VALID_SEARCH_TYPES}, but got '{searchType}'.\n\n{explanations}")
 
     # Get Tranco rankings 
-    t = Tranco(cache=True, cache_dir='.tranco')
-    latest_list = t.list()
-    
-    siteLst = latest_list.top(numSites)
+    siteLst = loadTrancoSites(numSites, trancoCSV)
     directory = "../privacy-policy-historical-master"
     
     # print(f"Looking for {siteLst}")
     
     # Search corpus for tranco website matches
     if searchType == "exact":
-        fileDict = findMatchingFiles(siteLst, directory, exact=True)
+        fileDict = findMatchingFiles(siteLst, directory, exact=True, catalog=catalog, workers=workers, index=index)
     elif searchType == "fuzzy":
-        fileDict = findMatchingFiles(siteLst, directory, exact=False)
+        fileDict = findMatchingFiles(siteLst, directory, exact=False, catalog=catalog, workers=workers)
     elif searchType == "exact-TLD:com":
+        fileDict = {}
+        batchResults = None
+        noIndex = catalog is None and index is None and not shard
+        daemonPaths = None
+        if noIndex and lookupDaemon.daemonServes(directory):
+            # The lookup daemon already has the catalog in memory
+            daemonPaths = lookupDaemon.daemonLookup(siteLst, bareCom=True)
+        if daemonPaths is not None:
+            batchResults = {corpusLookup.websiteDomain(website): path for website, path in zip(siteLst, daemonPaths)}
+        elif noIndex:
+            # No index to query (or the daemon didn't answer), so resolve every site in one pass over the corpus
+            batchResults = corpusLookup.findExactMatchesInDir(directory, siteLst, bareCom=True, workers=workers)
+
         # Recall findExactMatchInDirTLD only handles one file at a time 
         # and only returns one match
-        fileDict = {}
         for website in tqdm(siteLst):
-            result = findExactMatchInDirTLD(directory, website)
+            if batchResults is not None:
+                result = batchResults[corpusLookup.websiteDomain(website)]
+            else:
+                result = findExactMatchInDirTLD(directory, website, catalog=catalog, shard=shard, index=index)
             # Recall the function sometimes returns none, we don't want that
             if result is not None: 
                 # Need this to match the keys in findMatchingFiles's output
-                extracted_domain = tldextract.extract(website).domain
+                extracted_domain = domainParser.extract(website).domain
                 fileDict[extracted_domain] = result
     else:
         print(f"You've reached this branch in error")
@@ -63,7 +84,94 @@ def findTopSites(numSites, searchType = "exact"):
 
     return fileDict
 
-def findExactMatchInDirTLD(path, website):
+def readTrancoCSV(csvPath):
+    """
+    Reads a local Tranco snapshot e.g., the top-1m.csv from tranco-list.eu
+
+    Parameters:
+    - csvPath (str): Path to a headerless "rank,domain" CSV.
+
+    Returns:
+    - DataFrame: Columns "rank" and "site", in rank order.
+    """
+    return pd.read_csv(csvPath, header=None, names=["rank", "site"],
+                       dtype={"rank": int, "site": str}, keep_default_na=False)
+
+def loadTrancoSites(numSites, trancoCSV=None):
+    """
+    Gets the top N sites, from a local Tranco snapshot if one is given
+    or from the live Tranco service otherwise.
+
+    Parameters:
+    - numSites (int): the top N sites
+    - trancoCSV (str): Optional path to a local Tranco CSV.
+
+    Returns:
+    - list: Site names in rank order.
+    """
+    if trancoCSV is not None:
+        return readTrancoCSV(trancoCSV)["site"].head(numSites).tolist()
+
+    t = Tranco(cache=True, cache_dir='.tranco')
+    return t.list().top(numSites)
+
+def trancoRankMap(siteLst):
+    """
+    Builds a domain -> rank map so ranks are a dict lookup instead of a
+    fuzzyMatchIndex scan per domain.
+
+    Parameters:
+    - siteLst (list): Site names in rank order.
+
+    Returns:
+    - dict: Domain (as keyed in findTopSites' output) to its best 1-based rank.
+    """
+    rankMap = {}
+    for rank, parts in enumerate(domainParser.extractMany(siteLst), start=1):
+        rankMap.setdefault(parts.domain, rank)
+    return rankMap
+
+def corpusCoverage(tranco, catalog):
+    """
+    Joins a Tranco list against the corpus catalog in one vectorized pass,
+    using the same exact-TLD:com rule as findTopSites (a bare .com wins,
+    then the first match in walk order).
+
+    Parameters:
+    - tranco (DataFrame): Output of readTrancoCSV, any length (e.g., the full 1M).
+    - catalog (sqlite3.Connection): Open corpus catalog (see corpusCatalog.py).
+
+    Returns:
+    - tuple: (coverageTable, coverageCurve)
+        - coverageTable (DataFrame): rank, site, domain and the matching policy path (NaN if none).
+        - coverageCurve (DataFrame): for every N, the number of distinct domains
+          from the top N that are in the corpus and that as a fraction of N.
+    """
+    table = tranco[["rank", "site"]].copy()
+    table["domain"] = [parts.domain for parts in domainParser.extractMany(table["site"])]
+
+    # Same normalization as corpusLookup.websiteDomain
+    hasDot = table["site"].str.contains(".", regex=False)
+    lookupKey = table["domain"].where(hasDot, table["site"]).str.lower()
+
+    corpus = pd.read_sql_query("SELECT id, path, subdomain, domain, suffix FROM policies", catalog)
+    corpus["bareCom"] = (corpus["suffix"] == "com") & (corpus["subdomain"] == "")
+    bestPaths = (corpus.sort_values(["bareCom", "id"], ascending=[False, True])
+                       .drop_duplicates("domain")
+                       .set_index("domain")["path"])
+    table["path"] = lookupKey.map(bestPaths)
+
+    # findTopSites keys its output by domain, so a domain only counts once
+    newDomainInCorpus = table["path"].notna() & ~table["domain"].duplicated()
+    coverageCurve = pd.DataFrame({
+        "N": table["rank"],
+        "domainsInCorpus": newDomainInCorpus.cumsum(),
+    })
+    coverageCurve["coverage"] = coverageCurve["domainsInCorpus"] / coverageCurve["N"]
+
+    return table, coverageCurve
+
+def findExactMatchInDirTLD(path, website, catalog=None, shard=False, workers=None, index=None):
     """
     Searches for files in a directory (and its subdirectories) 
     that exactly match the provided domain, *prioritizing .com domains*.
@@ -71,13 +179,27 @@ def findExactMatchInDirTLD(path, website):
     Parameters:
     - path (str): The current directory path.
     - website (str): The website URL or name to use for matching.
+    - catalog (sqlite3.Connection): Optional corpus catalog to query instead of walking path.
+    - shard (bool): Only list the website's letter-shard directories (path must be the corpus root).
+    - workers (int): List the tree on this many threads (see corpusLookup.walkCorpus).
+    - index (dict): Optional memory-mapped domain index to query instead of walking path.
 
     Returns:
     - str or None: Returns the file path if a match is found, or None otherwise.
     """
+    if index is not None:
+        return domainIndex.indexExactMatchTLD(index, website, bareCom=True)
+    if catalog is not None:
+        return corpusCatalog.catalogExactMatchTLD(catalog, website, bareCom=True)
+    if shard:
+        return corpusLookup.findExactMatchInShard(path, website, bareCom=True)
+    if workers:
+        batchResults = corpusLookup.findExactMatchesInDir(path, [website], bareCom=True, workers=workers)
+        return batchResults[corpusLookup.websiteDomain(website)]
+
     # Take in website URL or name
     if "." in website:
-        domain = tldextract.extract(website).domain
+        domain = domainParser.extract(website).domain
     else:
         domain = website
 
@@ -85,7 +207,7 @@ def findExactMatchInDirTLD(path, website):
     foundComPath = None  # Store path if .com TLD is found
     foundOtherPath = None  # Store path if any other TLD is found
 
-    for entry in os.scandir(path):
+    for entry in corpusLookup.listDir(path):
         if entry.is_dir():
             # Recurse into the directory
             foundPath = findExactMatchInDirTLD(entry.path, website)
@@ -94,7 +216,7 @@ def findExactMatchInDirTLD(path, website):
             if foundPath:
                  # Extract the filename and TLD
                 fName = os.path.splitext(os.path.basename(foundPath))[0]
-                subDomain, _, ext = tldextract.extract(fName)
+                subDomain, _, ext = domainParser.extract(fName)
                 
                 # Check if the TLD is "com"
                 if ext == "com" and subDomain == '':
@@ -107,7 +229,7 @@ def findExactMatchInDirTLD(path, website):
         else:
             # # Extract the filename and URL parts
             baseName, _ = os.path.splitext(entry.name)
-            extractedResult = tldextract.extract(baseName)  # Extract domain and TLD
+            extractedResult = domainParser.extract(baseName)  # Extract domain and TLD
             
             # Check if the extracted domain matches our target domain
             if extractedResult.domain == domain:
@@ -153,7 +275,7 @@ def findMatchingFilesSlow(websites, directory):
 
     return matches
 
-def findExactMatchInDir(path, websites, matches, thresholds):
+def findExactMatchInDir(path, websites, matches, thresholds, workers=None):
     """
     Searches for files in a directory (and its subdirectories) 
     that exactly match the provided domains, up to a certain threshold.
@@ -163,23 +285,26 @@ def findExactMatchInDir(path, websites, matches, thresholds):
     - websites (list): A list of website URLs to use for matching.
     - matches (dict): A dictionary to store matching file paths for each domain.
     - thresholds (dict): Keeps track of match counts for each domain.
+    - workers (int): List the whole tree on this many threads instead of recursing.
     """
-    domains = [tldextract.extract(site).domain for site in websites]
+    # The parallel walker hands back every file in the tree, so there is nothing to recurse into
+    entries = corpusLookup.walkCorpus(path, workers) if workers else corpusLookup.listDir(path)
 
-    for entry in os.scandir(path):
+    for entry in entries:
         if entry.is_dir():
             # Recurse into the directory
             findExactMatchInDir(entry.path, websites, matches, thresholds)
         else:
             # Removing the actual file extension for comparison
             base_name, file_ext = os.path.splitext(entry.name)
-            extracted_domain = tldextract.extract(base_name).domain  # Extract the domain from the filename
+            extracted_domain = domainParser.extract(base_name).domain  # Extract the domain from the filename
             
-            if extracted_domain in domains and thresholds[extracted_domain] < 5:
+            # thresholds is keyed by the target domains, so this is a hash lookup
+            if extracted_domain in thresholds and thresholds[extracted_domain] < 5:
                 matches[extracted_domain].append(entry.path)
                 thresholds[extracted_domain] += 1
 
-def scanDir(path, websites, matches, thresholds):
+def scanDir(path, websites, matches, thresholds, automaton=None, workers=None):
     """
     Recursively scans a directory and its subdirectories for files matching given websites.
 
@@ -188,29 +313,37 @@ def scanDir(path, websites, matches, thresholds):
     - websites (list): A list of website URLs to search for.
     - matches (dict): A dictionary to store matching file paths for each domain.
     - thresholds (dict): Keeps track of match counts for each domain.
+    - automaton (dict): Aho-Corasick automaton over the domains in thresholds,
+      built on the first call and passed down the recursion.
+    - workers (int): List the whole tree on this many threads instead of recursing.
 
     Note:
     For each directory it encounters, it calls itself.
+    Each file name is scanned once for every domain it contains, so the cost
+    doesn't grow with the number of websites.
     """
-    for entry in os.scandir(path):
+    if automaton is None:
+        automaton = ahoCorasick.buildAutomaton(thresholds)
+
+    # The parallel walker hands back every file in the tree, so there is nothing to recurse into
+    entries = corpusLookup.walkCorpus(path, workers) if workers else corpusLookup.listDir(path)
+
+    for entry in entries:
         # If the current entry is a directory, we recursively scan its contents.
         if entry.is_dir():
-            scanDir(entry.path, websites, matches, thresholds)
+            scanDir(entry.path, websites, matches, thresholds, automaton)
         else:
             # Remove the actual file extension (like .md) before processing
             base_name = os.path.splitext(entry.name)[0]
 
-            for site in websites:
-                domain = tldextract.extract(site).domain  # Extracts the primary domain name, ignoring subdomains
-                
+            # Every domain that is found in the file name (base_name)
+            for domain in ahoCorasick.findPatterns(automaton, base_name):
                 # Check if we haven't reached the match limit for this domain
                 if thresholds[domain] < 5: 
-                    # If the domain is found in the file name (base_name), record the match
-                    if domain in base_name:
-                        matches[domain].append(entry.path)
-                        thresholds[domain] += 1  # Update the match count  # Update the match count
+                    matches[domain].append(entry.path)
+                    thresholds[domain] += 1  # Update the match count
 
-def findMatchingFiles(websites, directory, exact=False):
+def findMatchingFiles(websites, directory, exact=False, catalog=None, workers=None, index=None):
     """
     Search for files in a directory and its subdirectories with names matching the given websites.
 
@@ -218,25 +351,35 @@ def findMatchingFiles(websites, directory, exact=False):
     - websites (list): A list of website URLs to use for matching.
     - directory (str): Starting directory path for the search.
     - exact (bool): When true we only look for exact matches.
+    - catalog (sqlite3.Connection): Optional corpus catalog to query instead of walking directory.
+    - workers (int): List the corpus on this many threads (see corpusLookup.walkCorpus).
+    - index (dict): Optional memory-mapped domain index, used for exact searches.
 
     Returns:
     - dict: Dictionary with domains as keys and lists of matching file paths as values.
     """
+    if exact and index is not None:
+        return domainIndex.indexExactMatches(index, websites)
+    if catalog is not None:
+        if exact:
+            return corpusCatalog.catalogExactMatches(catalog, websites)
+        return corpusCatalog.catalogFuzzyMatches(catalog, websites)
+
     # Prepare dictionaries to store matches and thresholds
-    domains = [tldextract.extract(site).domain for site in websites]
+    domains = [parts.domain for parts in domainParser.extractMany(websites)]
     matches = {domain: [] for domain in domains}
     thresholds = {domain: 0 for domain in domains}
 
     if exact:
         # function for exact matches
-        findExactMatchInDir(directory, websites, matches, thresholds)
+        findExactMatchInDir(directory, websites, matches, thresholds, workers=workers)
     else:
         # recursive scan, non exact matches
-        scanDir(directory, websites, matches, thresholds)
+        scanDir(directory, websites, matches, thresholds, workers=workers)
 
     return matches
 
-def findFilesByTLDs(path, gtlds):
+def findFilesByTLDs(path, gtlds, catalog=None, workers=None, index=None):
     """
     Searches for files in a directory (and its subdirectories) 
     that contain specified gTLDs in their filenames.
@@ -244,22 +387,33 @@ def findFilesByTLDs(path, gtlds):
     Parameters:
     - path (str): The current directory path.
     - gtlds (list): List of gTLDs (like ['.com', '.org', ...]) to search for.
+    - catalog (sqlite3.Connection): Optional corpus catalog to query instead of walking path.
+    - workers (int): List the whole tree on this many threads instead of recursing.
+    - index (dict): Optional memory-mapped domain index to query instead of walking path.
 
     Returns:
     - dict: A dictionary with gTLDs as keys and lists of matching file paths as values.
     """
+    if index is not None:
+        return domainIndex.indexFilesByTLDs(index, gtlds)
+    if catalog is not None:
+        return corpusCatalog.catalogFilesByTLDs(catalog, gtlds)
+
     matches = {gtld: [] for gtld in gtlds}
 
-    for entry in os.scandir(path):
+    # The parallel walker hands back every file in the tree, so there is nothing to recurse into
+    entries = corpusLookup.walkCorpus(path, workers) if workers else corpusLookup.listDir(path)
+
+    for entry in entries:
         if entry.is_dir():
             # Merge dictionaries from recursive search
             sub_matches = findFilesByTLDs(entry.path, gtlds)
             for key in sub_matches:
                 matches[key].extend(sub_matches[key])
         else:
-            # Removing the actual file extension for tldextract to work correctly
+            # Removing the actual file extension for the domain parser to work correctly
             base_name, file_ext = os.path.splitext(entry.name)
-            extracted = tldextract.extract(base_name)
+            extracted = domainParser.extract(base_name)
             tld = '.' + extracted.suffix  # Getting the gTLD
             if tld in gtlds:
                 matches[tld].append(entry.path)
@@ -290,7 +444,7 @@ def fuzzyMatchIndex(myList, query):
     - int: The index of the first list element containing the query, or -1 if not found.
     """
     for index, element in enumerate(myList):
-        extracted_domain = tldextract.extract(element).domain
+        extracted_domain = domainParser.extract(element).domain
         if query == extracted_domain:
             return index
     return -1  # Return -1 if no match is found
@@ -324,18 +478,26 @@ if __name__ == '__main__':
     
     ## Print out the Tranco top N domains with ranking
     numSite = 200
-    results = findTopSites(numSite, searchType="exact-TLD:com")
-    t = Tranco(cache=True, cache_dir='.tranco')
-    trancoRank = t.list().top(numSite)
+    # Use a local Tranco snapshot when there is one, otherwise the live service
+    trancoCSV = "top-1m.csv" if os.path.exists("top-1m.csv") else None
+    # Build the corpus catalog once (or reuse it) so each site is an indexed query
+    catalog = corpusCatalog.loadCatalog("../privacy-policy-historical-master")
+    results = findTopSites(numSite, searchType="exact-TLD:com", catalog=catalog, trancoCSV=trancoCSV)
+    rankMap = trancoRankMap(loadTrancoSites(numSite, trancoCSV))
     # Print out the matching files for each domain
     domainCount = 0
     for domain, paths in results.items():
         if paths:
             domainCount += 1
-            print(f"Matching files for Rank {fuzzyMatchIndex(trancoRank, domain) + 1}: {domain}:")
+            print(f"Matching files for Rank {rankMap[domain]}: {domain}:")
             print(os.path.splitext(os.path.basename(paths))[0])
             # justURL(paths)
             # for path in paths:
             #     print(justURL(path))
             print("-" * 40)
     print(f"From the Tranco top {numSite}, there are {domainCount} domains in the corpus")
+
+    ## Corpus coverage vs. N for every N in the snapshot, in one run
+    # table, curve = corpusCoverage(readTrancoCSV("top-1m.csv"), catalog)
+    # table.to_csv("trancoCoverageTable.csv", index=False)
+    # curve.to_csv("trancoCoverageCurve.csv", index=False)
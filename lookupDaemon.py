@@ -0,0 +1,329 @@
+"""
+Optional long-lived lookup service for the corpus tools.
+Keeps the corpus catalog (and optionally the cl100k_base tokenizer) in memory
+and answers batched domain -> policy path lookups and token counts over
+localhost HTTP. checkSheetItems, gatherPopularSites and count_corpus use it
+automatically when it is running (lookups only when it serves the same corpus
+directory as the script), so small repeated runs skip loading the
+tokenizer and re-reading the corpus.
+
+The catalog is a snapshot: the daemon brings it up to date with
+corpusCatalog.refreshCatalog every REFRESH_INTERVAL seconds in the background,
+and on demand with POST /refresh (daemonRefresh, which returns at once while the
+refresh runs in the background), so files added to the corpus may be missing
+from lookups until the next refresh has finished.
+
+Start it with:
+    python lookupDaemon.py [--tokenizer] [--refresh-interval SECONDS]
+Set LOOKUP_DAEMON_PORT to use a port other than 8765 (for the daemon and the scripts).
+"""
+
+import argparse, json, os, sqlite3, threading, urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import corpusCatalog
+
+DEFAULT_PORT = int(os.environ.get("LOOKUP_DAEMON_PORT", 8765))
+DAEMON_URL = f"http://127.0.0.1:{DEFAULT_PORT}"
+
+# Short timeout so scripts don't stall when the daemon isn't up
+PING_TIMEOUT = 0.2
+
+# Seconds to wait for a lookup or token count reply before falling back to the in-process path
+REQUEST_TIMEOUT = 10
+
+# Seconds between background catalog refreshes in the daemon (0 turns them off)
+REFRESH_INTERVAL = 300
+
+# Cached result of the first ping from this process
+_daemonStatus = None
+
+
+## Client side
+
+def daemonStatus():
+    """
+    Checks (once per process) whether the daemon is running.
+
+    Returns:
+    - dict or None: The daemon's status e.g., {"status": "ok", "directory": "/abs/corpus", "tokenizer": True},
+      or None if it isn't running.
+    """
+    global _daemonStatus
+    if _daemonStatus is None:
+        try:
+            with urllib.request.urlopen(f"{DAEMON_URL}/ping", timeout=PING_TIMEOUT) as response:
+                _daemonStatus = json.loads(response.read())
+        except (OSError, ValueError):
+            _daemonStatus = {}
+
+    return _daemonStatus or None
+
+
+def daemonRunning():
+    """
+    True if the lookup daemon is running.
+    """
+    return daemonStatus() is not None
+
+
+def daemonServes(directoryPath):
+    """
+    True if the lookup daemon is running and serving the corpus at directoryPath,
+    so its lookups give the same answers as searching that directory. The paths
+    it returns are absolute (see corpusCatalog), so they resolve from the caller's
+    working directory too.
+    """
+    status = daemonStatus()
+    return bool(status and status.get("directory") == os.path.abspath(directoryPath))
+
+
+def daemonHasTokenizer():
+    """
+    True if the lookup daemon is running and was started with --tokenizer.
+    """
+    status = daemonStatus()
+    return bool(status and status.get("tokenizer"))
+
+
+def _post(endpoint, payload):
+    """
+    Sends a JSON request to the daemon and returns the decoded JSON reply, or None
+    if the daemon went away, errored or didn't answer within REQUEST_TIMEOUT.
+    After a failure the daemon is treated as not running for the rest of the process.
+    """
+    global _daemonStatus
+    request = urllib.request.Request(
+        f"{DAEMON_URL}/{endpoint}",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        # URLError, HTTPError and socket timeouts are all OSErrors
+        _daemonStatus = {}
+        return None
+
+
+def daemonLookup(websites, bareCom=True):
+    """
+    Batched version of findExactMatchInDirTLD answered by the daemon.
+
+    Parameters:
+    - websites (list): Website URLs or names to use for matching.
+    - bareCom (bool): When true a .com only wins if it has no subdomain
+      (gatherPopularSites' rule); checkSheetItems accepts any .com.
+
+    Returns:
+    - list or None: An absolute file path or None for each website, in order, or None if the
+      daemon couldn't answer (search the corpus in-process instead).
+    """
+    reply = _post("lookup", {"websites": list(websites), "bareCom": bareCom})
+    return reply["paths"] if reply is not None else None
+
+
+def daemonCountTokens(texts):
+    """
+    Counts cl100k_base tokens for a batch of texts using the daemon's tokenizer.
+
+    Parameters:
+    - texts (list): Plaintext strings.
+
+    Returns:
+    - list or None: Token count for each text, in order, or None if the daemon
+      couldn't answer (count in-process instead).
+    """
+    reply = _post("tokens", {"texts": list(texts)})
+    return reply["counts"] if reply is not None else None
+
+
+def daemonRefresh():
+    """
+    Asks the daemon to bring its catalog up to date with the corpus now. The
+    refresh runs in the background (walking a large corpus can take a while),
+    and lookups use the refreshed catalog once it's done.
+
+    Returns:
+    - bool or None: True if a refresh was started, False if one was already running,
+      or None if the daemon couldn't answer.
+    """
+    reply = _post("refresh", {})
+    return reply["started"] if reply is not None else None
+
+
+## Server side
+
+class LookupHandler(BaseHTTPRequestHandler):
+    """
+    Handles the daemon's endpoints: GET /ping, POST /lookup, POST /tokens and POST /refresh.
+    """
+
+    def do_GET(self):
+        if self.path == "/ping":
+            self._reply({"status": "ok", "directory": self.server.directory,
+                         "tokenizer": self.server.encoding is not None})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length)) if length else {}
+        except ValueError:
+            self.send_error(400, "Request body must be JSON")
+            return
+
+        if self.path == "/lookup":
+            bareCom = payload.get("bareCom", True)
+            with self.server.catalogLock:
+                paths = [corpusCatalog.catalogExactMatchTLD(self.server.catalog, website, bareCom=bareCom)
+                         for website in payload["websites"]]
+            self._reply({"paths": paths})
+        elif self.path == "/tokens":
+            if self.server.encoding is None:
+                self.send_error(503, "Daemon was started without --tokenizer")
+                return
+            counts = [len(tokens) for tokens in self.server.encoding.encode_batch(payload["texts"])]
+            self._reply({"counts": counts})
+        elif self.path == "/refresh":
+            self._reply({"started": _startRefresh(self.server)})
+        else:
+            self.send_error(404)
+
+    def _reply(self, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Scripts fire lots of small requests, keep the terminal quiet
+        pass
+
+
+def _memoryCatalog(diskCatalog):
+    """
+    Copies the on-disk catalog into an in-memory database shared by the handler threads.
+    """
+    catalog = sqlite3.connect(":memory:", check_same_thread=False)
+    diskCatalog.backup(catalog)
+    return catalog
+
+
+def refreshServerCatalog(server):
+    """
+    Brings the on-disk catalog up to date with corpusCatalog.refreshCatalog and,
+    if anything changed, swaps a fresh in-memory copy in. Lookups keep using the
+    old copy while the refresh runs.
+
+    Parameters:
+    - server (ThreadingHTTPServer): The daemon's server.
+
+    Returns:
+    - tuple: Number of policies (added, removed, updated).
+    """
+    with server.refreshLock:
+        diskCatalog = corpusCatalog.loadCatalog(server.directory, server.catalogPath, refresh=False)
+        changes = corpusCatalog.refreshCatalog(diskCatalog, server.directory)
+        if any(changes):
+            catalog = _memoryCatalog(diskCatalog)
+            with server.catalogLock:
+                oldCatalog, server.catalog = server.catalog, catalog
+            oldCatalog.close()
+        diskCatalog.close()
+
+    return changes
+
+
+def _refreshAndReport(server):
+    """
+    Runs refreshServerCatalog and prints what changed, or why it failed.
+    """
+    try:
+        added, removed, updated = refreshServerCatalog(server)
+    except (OSError, sqlite3.Error) as error:
+        print(f"Catalog refresh failed: {error}")
+        return
+    if added or removed or updated:
+        print(f"Catalog refreshed: {added:,} added, {removed:,} removed, {updated:,} updated")
+
+
+def _startRefresh(server):
+    """
+    Starts a catalog refresh on a background thread, unless one is already running.
+
+    Returns:
+    - bool: True if a refresh was started.
+    """
+    if server.refreshLock.locked():
+        return False
+    threading.Thread(target=_refreshAndReport, args=(server,), daemon=True).start()
+    return True
+
+
+def _refreshPeriodically(server, interval):
+    """
+    Runs refreshServerCatalog every interval seconds until the server stops.
+    """
+    while not server.stopRefreshing.wait(interval):
+        _refreshAndReport(server)
+
+
+def serve(directory, port=DEFAULT_PORT, loadTokenizer=False, catalogPath=corpusCatalog.DEFAULT_CATALOG_PATH,
+          refreshInterval=REFRESH_INTERVAL):
+    """
+    Loads the catalog into memory and serves lookups until interrupted.
+
+    Parameters:
+    - directory (str): Root of the corpus.
+    - port (int): Localhost port to listen on.
+    - loadTokenizer (bool): Also load cl100k_base and answer /tokens.
+    - catalogPath (str): Location of the SQLite catalog.
+    - refreshInterval (float): Seconds between background catalog refreshes, 0 or None for none.
+    """
+    diskCatalog = corpusCatalog.loadCatalog(directory, catalogPath)
+    catalog = _memoryCatalog(diskCatalog)
+    diskCatalog.close()
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), LookupHandler)
+    server.directory = os.path.abspath(directory)
+    server.catalogPath = catalogPath
+    server.catalog = catalog
+    server.catalogLock = threading.Lock()
+    server.refreshLock = threading.Lock()
+    server.stopRefreshing = threading.Event()
+    server.encoding = None
+
+    if loadTokenizer:
+        import tiktoken
+        print("Loading in Tokenizer from tiktoken...")
+        server.encoding = tiktoken.get_encoding("cl100k_base")
+
+    numFiles = catalog.execute("SELECT COUNT(*) FROM policies").fetchone()[0]
+    print(f"Serving {numFiles:,} policies from {server.directory} on 127.0.0.1:{port} (Ctrl+C to stop)")
+
+    if refreshInterval:
+        threading.Thread(target=_refreshPeriodically, args=(server, refreshInterval), daemon=True).start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stopRefreshing.set()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve corpus lookups and token counts from memory.")
+    parser.add_argument("--directory", default="../privacy-policy-historical-master", help="Root of the corpus")
+    parser.add_argument("--tokenizer", action="store_true", help="Also load cl100k_base and serve token counts")
+    parser.add_argument("--refresh-interval", type=float, default=REFRESH_INTERVAL,
+                        help="Seconds between catalog refreshes, 0 to turn them off")
+    args = parser.parse_args()
+
+    serve(args.directory, loadTokenizer=args.tokenizer, refreshInterval=args.refresh_interval)
@@ -0,0 +1,225 @@
+"""
+Shared Markdown stripping engine for count_corpus and convert_corpus.
+stripMarkdown gives byte-for-byte the same output as the original nine
+re.sub version (kept below as stripMarkdownReference) but every step runs in
+linear time: the header and link/image removals are plain forward scans
+instead of backtracking regexes, and the #, * and ` deletions are a single
+str.translate call.
+The steps still run in the original order because one removal can expose
+another e.g., dropping the image in "[a![b](c)](d)" leaves a link behind.
+
+Run this file to benchmark both versions on real corpus files:
+    python markdownStrip.py [corpusDirectory] [numFiles]
+"""
+
+import os, re, sys, time
+
+# Bump whenever stripMarkdown's output changes; the text and token count caches key on it
+STRIP_VERSION = 1
+
+# Emphasis, headers and inline code markers are deleted outright
+_DELETE_CHARS = str.maketrans('', '', '#*`')
+
+# These two are left as regexes; neither can backtrack more than a line's worth
+_blockquoteRe = re.compile(r'^>\s+', flags=re.M)
+_horizontalRuleRe = re.compile(r'^[\-_*]\s*[\-_*]\s*[\-_*]\s*$', flags=re.M)
+
+
+def stripMarkdown(markdownContent):
+    """
+    Strips common Markdown elements from a given string containing Markdown content.
+
+    Parameters:
+    - markdownContent (str): The content string with Markdown formatting.
+
+    Returns:
+    - str: The content with Markdown elements removed.
+    """
+    # Block quote of metadata at the top of the file
+    content = _removeHeaderBlock(markdownContent)
+
+    # Images ![alt_text](url), then links [link_text](url)
+    content = _removeBracketLinks(content, "![")
+    content = _removeBracketLinks(content, "[")
+
+    # Headers (#), emphasis (*) and inline code (`)
+    # Code blocks need no pass of their own once the backticks are gone
+    content = content.translate(_DELETE_CHARS)
+
+    # Blockquotes: > quote
+    content = _blockquoteRe.sub('', content)
+
+    # Horizontal lines: --- or - - -
+    content = _horizontalRuleRe.sub('', content)
+
+    return content
+
+
+def _removeHeaderBlock(content):
+    """
+    Linear version of re.sub(r'^(?:>.*\\n)+\\n(?=# )', '', content, flags=re.M):
+    drops every run of ">" lines that is followed by a blank line and a "# " heading,
+    along with the blank line.
+    """
+    pieces = []
+    copiedUpTo = 0
+    lineStart = 0
+    length = len(content)
+
+    while lineStart < length:
+        if content[lineStart] != '>':
+            newline = content.find('\n', lineStart)
+            if newline == -1:
+                break
+            lineStart = newline + 1
+            continue
+
+        runStart = lineStart
+        while lineStart < length and content[lineStart] == '>':
+            newline = content.find('\n', lineStart)
+            if newline == -1:
+                # The last line has no newline, so the run can't be followed by a blank line
+                lineStart = length
+                break
+            lineStart = newline + 1
+
+        if content.startswith('\n# ', lineStart):
+            pieces.append(content[copiedUpTo:runStart])
+            copiedUpTo = lineStart + 1
+            lineStart += 1
+
+    if not pieces:
+        return content
+
+    pieces.append(content[copiedUpTo:])
+    return ''.join(pieces)
+
+
+def _removeBracketLinks(content, opener):
+    """
+    Linear version of re.sub(r'\\[.*?\\]\\(.*?\\)', '', content), or the image
+    pattern when opener is "![". A match runs from the opener to the first ")"
+    after the first "](" on the same line. Once an opener has no such ")" no
+    later opener on that line can have one either, so the scan skips ahead to
+    the next line and every character is looked at a bounded number of times.
+    """
+    pieces = []
+    copiedUpTo = 0
+    searchFrom = 0
+    length = len(content)
+
+    while True:
+        start = content.find(opener, searchFrom)
+        if start == -1:
+            break
+
+        lineEnd = content.find('\n', start)
+        if lineEnd == -1:
+            lineEnd = length
+
+        middle = content.find('](', start + len(opener), lineEnd)
+        end = content.find(')', middle + 2, lineEnd) if middle != -1 else -1
+
+        if end == -1:
+            searchFrom = lineEnd
+            continue
+
+        pieces.append(content[copiedUpTo:start])
+        copiedUpTo = searchFrom = end + 1
+
+    if not pieces:
+        return content
+
+    pieces.append(content[copiedUpTo:])
+    return ''.join(pieces)
+
+
+def stripMarkdownReference(markdownContent):
+    """
+    The original regex version of stripMarkdown, kept to check and benchmark the engine against.
+
+    Parameters:
+    - markdownContent (str): The content string with Markdown formatting.
+
+    Returns:
+    - str: The content with Markdown elements removed.
+    """
+
+    content = markdownContent
+
+    ### REMOVE THE BLOCK QUOTE AT THE TOP OF THE FILE ##
+    # This will match everything starting from the first block quote to the newline just before the first top-level heading.
+    pattern = r'^(?:>.*\n)+\n(?=# )'
+
+    # Replace the matched block quote with an empty string
+    content = re.sub(pattern, '', content, flags=re.MULTILINE)
+
+    # Links: ![alt_text](url) or [link_text](url)
+    content = re.sub(r'!\[.*?\]\(.*?\)', '', content)  # Images
+    content = re.sub(r'\[.*?\]\(.*?\)', '', content)   # Links
+
+    # Headers: # or ## or ### etc.
+    content = re.sub(r'#+', '', content)
+
+    # Emphasis: *italic* or **bold** or ***bolditalic***
+    content = re.sub(r'\*+', '', content)
+
+    ## Jake: leaving this in because we finetuned on lists
+    # Lists: - item or * item or + item
+    # content = re.sub(r'^[-\*+]\s+', '', content, flags=re.M)
+
+    # Inline Code: `code`
+    content = re.sub(r'`', '', content)
+
+    # Blockquotes: > quote
+    content = re.sub(r'^>\s+', '', content, flags=re.M)
+
+    # Horizontal lines: --- or *** or - - -
+    content = re.sub(r'^[\-_*]\s*[\-_*]\s*[\-_*]\s*$', '', content, flags=re.M)
+
+    # Code blocks: ```code```
+    content = re.sub(r'```.*?```', '', content, flags=re.S)
+
+    return content
+
+
+def benchmark(directory, numFiles=2000):
+    """
+    Times stripMarkdown against stripMarkdownReference on corpus files and
+    checks that both give the same output.
+
+    Parameters:
+    - directory (str): Root of the corpus.
+    - numFiles (int): How many .md files to read.
+
+    Returns:
+    - None
+    """
+    documents = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.md'):
+                with open(os.path.join(root, name), 'r', encoding='utf-8') as file:
+                    documents.append(file.read())
+            if len(documents) >= numFiles:
+                break
+        if len(documents) >= numFiles:
+            break
+
+    totalMB = sum(len(document.encode('utf-8')) for document in documents) / 1e6
+    print(f"Read {len(documents):,} documents ({totalMB:.1f} MB)")
+
+    for label, function in [("reference", stripMarkdownReference), ("engine", stripMarkdown)]:
+        startTime = time.perf_counter()
+        for document in documents:
+            function(document)
+        elapsed = time.perf_counter() - startTime
+        print(f"{label:>9}: {elapsed:.3f} s, {totalMB / elapsed:.1f} MB/s")
+
+    mismatches = sum(stripMarkdown(document) != stripMarkdownReference(document) for document in documents)
+    print(f"Outputs differ on {mismatches} of {len(documents):,} documents")
+
+
+if __name__ == '__main__':
+    corpusDir = sys.argv[1] if len(sys.argv) > 1 else "../privacy-policy-historical-master"
+    benchmark(corpusDir, int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
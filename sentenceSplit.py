@@ -0,0 +1,254 @@
+"""
+Sentence segmenters for convert_corpus.
+A segmenter is a dict with a "name" and a "split" function that takes one
+paragraph and returns its sentences, each a verbatim slice of the paragraph.
+The name is part of the text cache key, so change it whenever the splitting changes.
+
+- "punkt": NLTK's Punkt model, loaded once and reused. Same output as sent_tokenize.
+- "rules": a precompiled rule-based splitter tuned to privacy-policy prose
+  (abbreviations like "e.g." and "Inc.", initials, section and list numbers).
+
+Run this file for an agreement report and a throughput benchmark of both against
+sent_tokenize on corpus files:
+    python sentenceSplit.py [corpusDirectory] [numFiles]
+"""
+
+import os, re, sys, time
+
+# Bump whenever ruleSplit's output changes
+RULES_VERSION = 1
+
+# Lowercased words (without their final period) that don't end a sentence
+ABBREVIATIONS = {
+    "e.g", "i.e", "eg", "ie", "cf", "vs", "viz", "al", "approx", "incl", "esp",
+    "inc", "ltd", "llc", "llp", "co", "corp", "plc", "gmbh", "bros", "assn", "dept",
+    "no", "nos", "sec", "secs", "art", "para", "ch", "pp", "fig", "vol", "ed",
+    "u.s", "u.s.a", "u.k", "e.u", "u.n",
+    "mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "ave", "blvd", "rd", "ste",
+    "jan", "feb", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+}
+
+# Words that end a sentence only when the next word is capitalized
+AMBIGUOUS_ABBREVIATIONS = {"etc", "a.m", "p.m"}
+
+# ., ! or ? (plus closing quotes and brackets) followed by whitespace, and the
+# first character of the next word
+_candidateRe = re.compile(r'[.!?][\'"’”)\]]*(?=\s+(\S))')
+
+# Section and list numbers: 1, 2.3, 4(a), iv, (b)
+_numberRe = re.compile(r'\(?(?:\d+(?:\.\d+)*(?:\([a-z0-9]+\))?|[ivx]{1,4}|[a-z])\)?')
+
+_OPENERS = '(["\'‘“['
+_CLOSERS = '"\')]’”'
+
+_segmenters = {}
+
+
+def getSegmenter(kind="punkt", language="english"):
+    """
+    Returns a segmenter, building it on first use and reusing it afterwards.
+
+    Parameters:
+    - kind (str): "punkt" or "rules".
+    - language (str): Punkt model to load, for "punkt".
+
+    Returns:
+    - dict: The segmenter, with keys "name" and "split".
+    """
+    key = (kind, language)
+    if key not in _segmenters:
+        if kind == "punkt":
+            _segmenters[key] = punktSegmenter(language)
+        elif kind == "rules":
+            _segmenters[key] = {"name": f"rules-{RULES_VERSION}", "split": ruleSplit}
+        else:
+            raise ValueError(f"Unknown segmenter: {kind}")
+
+    return _segmenters[key]
+
+
+def punktSegmenter(language="english"):
+    """
+    Loads NLTK's Punkt model once; sent_tokenize looks it up on every call.
+
+    Parameters:
+    - language (str): Name of the Punkt model.
+
+    Returns:
+    - dict: The segmenter, with keys "name" and "split".
+    """
+    try:
+        # NLTK 3.8.2 and up (punkt_tab)
+        from nltk.tokenize import PunktTokenizer
+        tokenizer = PunktTokenizer(language)
+    except ImportError:
+        import nltk
+        tokenizer = nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+
+    return {"name": f"punkt-{language}", "split": tokenizer.tokenize}
+
+
+def ruleSplit(paragraph):
+    """
+    Splits a paragraph into sentences after ., ! and ? (and any closing quotes
+    or brackets) that are followed by whitespace, except after abbreviations,
+    initials and section numbers. Whitespace is kept the way Punkt keeps it:
+    the first sentence starts at the start of the paragraph, the others at
+    their first word, and the last one has trailing whitespace removed.
+
+    Parameters:
+    - paragraph (str): One line of plaintext.
+
+    Returns:
+    - list: The sentences.
+    """
+    sentences = []
+    sentenceStart = 0
+    firstWord = len(paragraph) - len(paragraph.lstrip())
+
+    for match in _candidateRe.finditer(paragraph):
+        wordStart = match.start()
+        while wordStart > 0 and not paragraph[wordStart - 1].isspace():
+            wordStart -= 1
+
+        if _endsSentence(paragraph[wordStart:match.end()], match.group(1), wordStart == firstWord):
+            sentences.append(paragraph[sentenceStart:match.end()])
+            sentenceStart = firstWord = paragraph.find(match.group(1), match.end())
+
+    last = paragraph[sentenceStart:].rstrip()
+    if last:
+        sentences.append(last)
+
+    return sentences
+
+
+def _endsSentence(word, nextChar, startsSentence):
+    """
+    Decides whether a word ending in ., ! or ? ends its sentence.
+
+    Parameters:
+    - word (str): The word, with its punctuation.
+    - nextChar (str): First character of the next word.
+    - startsSentence (bool): Whether the word is also the first of its sentence.
+
+    Returns:
+    - bool: True for a sentence boundary after the word.
+    """
+    core = word.rstrip(_CLOSERS)
+    if not core.endswith('.'):
+        return True
+
+    # Ellipsis
+    if core.endswith('..'):
+        return nextChar.isupper()
+
+    stem = core[:-1].lstrip(_OPENERS).lower()
+    if not stem:
+        return True
+    if stem in ABBREVIATIONS:
+        return False
+    if stem in AMBIGUOUS_ABBREVIATIONS:
+        return nextChar.isupper()
+
+    # "1." or "(b)." at the start of a sentence is a list or section number, elsewhere
+    # a number ends a sentence unless a lowercase word follows e.g., "Section 2. of"
+    if _numberRe.fullmatch(stem):
+        if startsSentence or len(stem) == 1 and stem.isalpha():
+            return False
+        return not nextChar.islower()
+
+    return True
+
+
+def paragraphBoundaries(sentences):
+    """
+    Sentence end offsets within a paragraph, for comparing segmenters.
+
+    Parameters:
+    - sentences (list): Sentences from a segmenter, verbatim slices of the paragraph.
+
+    Returns:
+    - set: Offset where each sentence but the last ends, counted in non-whitespace characters.
+    """
+    boundaries = set()
+    position = 0
+    for sentence in sentences[:-1]:
+        position += len(''.join(sentence.split()))
+        boundaries.add(position)
+    return boundaries
+
+
+def compareSegmenters(directory, numFiles=500, kinds=("punkt", "rules"), numExamples=5):
+    """
+    Agreement report and throughput benchmark of the segmenters against
+    sent_tokenize, called once per paragraph as convert_corpus used to.
+
+    Parameters:
+    - directory (str): Root of the corpus.
+    - numFiles (int): How many .md files to read.
+    - kinds (tuple): Segmenters to compare.
+    - numExamples (int): Disagreeing sentences to print for each segmenter.
+
+    Returns:
+    - dict: For each segmenter, "seconds", "precision", "recall" and "paragraphAgreement".
+    """
+    from nltk.tokenize import sent_tokenize
+    from markdownStrip import stripMarkdown
+
+    paragraphs = []
+    numDocuments = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.md') and numDocuments < numFiles:
+                with open(os.path.join(root, name), 'r', encoding='utf-8') as file:
+                    paragraphs.extend(stripMarkdown(file.read()).split('\n'))
+                numDocuments += 1
+        if numDocuments >= numFiles:
+            break
+
+    totalMB = sum(len(paragraph.encode('utf-8')) for paragraph in paragraphs) / 1e6
+    print(f"Read {numDocuments:,} documents ({totalMB:.1f} MB, {len(paragraphs):,} paragraphs)")
+
+    startTime = time.perf_counter()
+    reference = [sent_tokenize(paragraph) for paragraph in paragraphs]
+    referenceSeconds = time.perf_counter() - startTime
+    print(f"{'sent_tokenize':>13}: {referenceSeconds:.3f} s, {totalMB / referenceSeconds:.1f} MB/s")
+
+    report = {}
+    for kind in kinds:
+        split = getSegmenter(kind)["split"]
+        startTime = time.perf_counter()
+        results = [split(paragraph) for paragraph in paragraphs]
+        seconds = time.perf_counter() - startTime
+
+        truePositives = numFound = numExpected = numSameParagraphs = 0
+        examples = []
+        for paragraph, expected, found in zip(paragraphs, reference, results):
+            expectedBoundaries, foundBoundaries = paragraphBoundaries(expected), paragraphBoundaries(found)
+            truePositives += len(expectedBoundaries & foundBoundaries)
+            numExpected += len(expectedBoundaries)
+            numFound += len(foundBoundaries)
+            if expected == found:
+                numSameParagraphs += 1
+            elif len(examples) < numExamples:
+                examples.append((expected, found))
+
+        report[kind] = {
+            "seconds": seconds,
+            "precision": truePositives / numFound if numFound else 1.0,
+            "recall": truePositives / numExpected if numExpected else 1.0,
+            "paragraphAgreement": numSameParagraphs / len(paragraphs) if paragraphs else 1.0,
+        }
+        print(f"{kind:>13}: {seconds:.3f} s, {totalMB / seconds:.1f} MB/s ({referenceSeconds / seconds:.1f}x), "
+              f"boundary precision {report[kind]['precision']:.2%}, recall {report[kind]['recall']:.2%}, "
+              f"identical paragraphs {report[kind]['paragraphAgreement']:.2%}")
+        for expected, found in examples:
+            print(f"    sent_tokenize: {expected}")
+            print(f"    {kind:>13}: {found}")
+
+    return report
+
+
+if __name__ == '__main__':
+    corpusDir = sys.argv[1] if len(sys.argv) > 1 else "../privacy-policy-historical-master"
+    compareSegmenters(corpusDir, int(sys.argv[2]) if len(sys.argv) > 2 else 500)
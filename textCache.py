@@ -0,0 +1,311 @@
+"""
+Content-addressed on-disk cache (SQLite) of the text derived from corpus documents.
+Entries are keyed by the SHA-256 of the source .md file plus a version, and
+hold the stripMarkdown plaintext and, for convert_corpus, the sentence boundary
+offsets from a sentence segmenter (see sentenceSplit.py). A repeated count_corpus or convert_corpus run on the same
+documents reads and hashes each file but skips stripping and splitting entirely.
+The cache is bounded in size; the least recently used entries are evicted first.
+New entries and last-used times are written in short batches (see FLUSH_EVERY),
+so several runs can share the cache and an interrupted run keeps what it stored.
+
+Bump markdownStrip.STRIP_VERSION when stripMarkdown changes. Sentence entries are
+also keyed by the segmenter's name, which changes with its splitting.
+"""
+
+import hashlib, sqlite3, time, zlib
+from array import array
+
+from markdownStrip import STRIP_VERSION, stripMarkdown
+
+DEFAULT_CACHE_PATH = ".text_cache.sqlite"
+
+# Upper bound on the compressed size of all entries, in bytes
+DEFAULT_MAX_BYTES = 1 << 30
+
+# Pending writes are committed in one short transaction every FLUSH_EVERY
+# entries or FLUSH_SECONDS seconds, whichever comes first
+FLUSH_EVERY = 100
+FLUSH_SECONDS = 10
+
+# Version of plaintext-only entries; sentence entries add the segmenter's name
+CACHE_VERSION = f"strip-{STRIP_VERSION}"
+
+
+def openCache(cachePath=DEFAULT_CACHE_PATH, maxBytes=DEFAULT_MAX_BYTES):
+    """
+    Opens (or creates) the cache.
+
+    Parameters:
+    - cachePath (str): Location of the SQLite file.
+    - maxBytes (int): Size bound; older entries are evicted past it.
+
+    Returns:
+    - dict: The cache, with keys "db", "maxBytes", "totalBytes", "hits" and "misses".
+    """
+    db = sqlite3.connect(cachePath, timeout=30)
+    # Readers aren't blocked while another run commits
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS entries (
+            hash TEXT NOT NULL,
+            version TEXT NOT NULL,
+            plaintext BLOB NOT NULL,
+            spans BLOB,
+            size INTEGER NOT NULL,
+            lastUsed REAL NOT NULL,
+            PRIMARY KEY (hash, version)
+        );
+        CREATE INDEX IF NOT EXISTS entries_lastUsed ON entries (lastUsed);
+    """)
+    totalBytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    return {
+        "db": db, "maxBytes": maxBytes, "totalBytes": totalBytes, "hits": 0, "misses": 0,
+        # Entries and last-used times waiting for the next flush
+        "pending": {}, "touched": {}, "lastFlush": time.monotonic(),
+    }
+
+
+def closeCache(cache):
+    """
+    Writes pending entries, evicts down to the size bound and closes the cache.
+    """
+    _flush(cache)
+    _evict(cache)
+    cache["db"].close()
+
+
+def _flush(cache):
+    """
+    Commits the pending entries and last-used times in one transaction.
+    """
+    db = cache["db"]
+    with db:
+        db.executemany(
+            "INSERT OR REPLACE INTO entries (hash, version, plaintext, spans, size, lastUsed) VALUES (?, ?, ?, ?, ?, ?)",
+            [key + entry for key, entry in cache["pending"].items()]
+        )
+        db.executemany(
+            "UPDATE entries SET lastUsed = ? WHERE hash = ? AND version = ?",
+            [(lastUsed,) + key for key, lastUsed in cache["touched"].items()]
+        )
+    cache["pending"].clear()
+    cache["touched"].clear()
+    cache["lastFlush"] = time.monotonic()
+
+
+def _maybeFlush(cache):
+    """
+    Flushes once FLUSH_EVERY writes are pending or FLUSH_SECONDS have passed since the last flush.
+    """
+    numPending = len(cache["pending"]) + len(cache["touched"])
+    if numPending >= FLUSH_EVERY or numPending and time.monotonic() - cache["lastFlush"] >= FLUSH_SECONDS:
+        _flush(cache)
+
+
+def readSource(filePath):
+    """
+    Reads a corpus document once, returning its hash, size and text.
+    The text is decoded the same way as open(filePath, 'r', encoding='utf-8').
+
+    Parameters:
+    - filePath (str): Path to the .md file.
+
+    Returns:
+    - tuple: (hex SHA-256 of the file's bytes, size in bytes, text)
+    """
+    with open(filePath, 'rb') as file:
+        raw = file.read()
+
+    # Universal newlines, as text mode would do
+    text = raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    return hashlib.sha256(raw).hexdigest(), len(raw), text
+
+
+def getPlaintextEntry(cache, filePath):
+    """
+    Returns stripMarkdown of a corpus document, from the cache when possible,
+    along with what it learned about the source file.
+
+    Parameters:
+    - cache (dict): Cache from openCache.
+    - filePath (str): Path to the .md file.
+
+    Returns:
+    - tuple: (hex SHA-256 of the file, size in bytes, plaintext)
+    """
+    contentHash, size, text = readSource(filePath)
+
+    entry = _lookup(cache, contentHash, CACHE_VERSION)
+    if entry is not None:
+        return contentHash, size, entry[0]
+
+    plainText = stripMarkdown(text)
+    _store(cache, contentHash, CACHE_VERSION, plainText, None)
+    return contentHash, size, plainText
+
+
+def getSentences(cache, filePath, segmenter):
+    """
+    Returns a corpus document's plaintext split into paragraphs (on newlines)
+    and sentences, from the cache when possible.
+
+    Parameters:
+    - cache (dict): Cache from openCache, or None to always strip and split.
+    - filePath (str): Path to the .md file.
+    - segmenter (dict): Segmenter from sentenceSplit.getSegmenter, applied to each paragraph.
+
+    Returns:
+    - tuple: (plaintext, iterable with a list of sentences for every paragraph in
+      plaintext.split('\\n')). The sentences are sliced out of the plaintext as
+      the paragraphs are iterated, so only their offsets are held in memory.
+    """
+    contentHash, _, text = readSource(filePath)
+    if cache is None:
+        plainText = stripMarkdown(text)
+        return plainText, (segmenter["split"](paragraph) for paragraph in plainText.split('\n'))
+
+    version = f"{CACHE_VERSION}/{segmenter['name']}"
+
+    entry = _lookup(cache, contentHash, version)
+    if entry is not None and entry[1] is not None:
+        return entry[0], iterParagraphs(entry[0], entry[1])
+
+    plainText = entry[0] if entry is not None else stripMarkdown(text)
+    paragraphs = [segmenter["split"](paragraph) for paragraph in plainText.split('\n')]
+
+    spans = paragraphsToSpans(plainText, paragraphs)
+    _store(cache, contentHash, version, plainText, spans)
+    if spans is None:
+        return plainText, paragraphs
+    return plainText, iterParagraphs(plainText, spans)
+
+
+def paragraphsToSpans(plainText, paragraphs):
+    """
+    Turns per-paragraph sentence lists into flat (start, end) offsets into plainText.
+    Each paragraph's offsets are preceded by its sentence count, so paragraphs
+    without sentences survive the round trip.
+
+    Parameters:
+    - plainText (str): The text that was split.
+    - paragraphs (list): A list of sentences for each paragraph of plainText.split('\\n').
+
+    Returns:
+    - array or None: The counts and offsets, or None if a sentence isn't a
+      verbatim slice of its paragraph.
+    """
+    spans = array("q")
+    paragraphStart = 0
+
+    for paragraphText, sentences in zip(plainText.split('\n'), paragraphs):
+        spans.append(len(sentences))
+        position = 0
+        for sentence in sentences:
+            start = paragraphText.find(sentence, position)
+            if start == -1:
+                return None
+            position = start + len(sentence)
+            spans.extend((paragraphStart + start, paragraphStart + position))
+        paragraphStart += len(paragraphText) + 1
+
+    return spans
+
+
+def iterParagraphs(plainText, spans):
+    """
+    Inverse of paragraphsToSpans, one paragraph at a time.
+
+    Parameters:
+    - plainText (str): The cached plaintext.
+    - spans (array): Offsets from paragraphsToSpans.
+
+    Yields:
+    - list: The sentences of each paragraph in turn.
+    """
+    i = 0
+    while i < len(spans):
+        numSentences = spans[i]
+        i += 1
+        yield [plainText[spans[j]:spans[j + 1]] for j in range(i, i + 2 * numSentences, 2)]
+        i += 2 * numSentences
+
+
+def _lookup(cache, contentHash, version):
+    """
+    Fetches an entry and marks it as recently used.
+
+    Returns:
+    - tuple or None: (plaintext, spans array or None), or None on a miss.
+    """
+    key = (contentHash, version)
+    if key in cache["pending"]:
+        row = cache["pending"][key]
+    else:
+        row = cache["db"].execute(
+            "SELECT plaintext, spans FROM entries WHERE hash = ? AND version = ?", key
+        ).fetchone()
+
+    if row is None:
+        cache["misses"] += 1
+        return None
+
+    cache["hits"] += 1
+    if key not in cache["pending"]:
+        cache["touched"][key] = time.time()
+        _maybeFlush(cache)
+
+    spans = None
+    if row[1] is not None:
+        spans = array("q")
+        spans.frombytes(zlib.decompress(row[1]))
+    return zlib.decompress(row[0]).decode('utf-8'), spans
+
+
+def _store(cache, contentHash, version, plainText, spans):
+    """
+    Queues an entry to be inserted or replaced at the next flush, evicting old
+    entries once the cache grows past its bound.
+    """
+    key = (contentHash, version)
+    plainBlob = zlib.compress(plainText.encode('utf-8'))
+    spansBlob = zlib.compress(spans.tobytes()) if spans is not None else None
+    size = len(plainBlob) + len(spansBlob or b"")
+
+    if key in cache["pending"]:
+        previous = cache["pending"][key][2:3]
+    else:
+        previous = cache["db"].execute("SELECT size FROM entries WHERE hash = ? AND version = ?", key).fetchone()
+    if previous is not None:
+        cache["totalBytes"] -= previous[0]
+
+    cache["pending"][key] = (plainBlob, spansBlob, size, time.time())
+    cache["touched"].pop(key, None)
+    cache["totalBytes"] += size
+
+    if cache["totalBytes"] > cache["maxBytes"]:
+        _flush(cache)
+        _evict(cache)
+    else:
+        _maybeFlush(cache)
+
+
+def _evict(cache):
+    """
+    Deletes least recently used entries (any version) until the cache is within its bound.
+    Evicts down to 90% of the bound so it doesn't run on every insert.
+    """
+    if cache["totalBytes"] <= cache["maxBytes"]:
+        return
+
+    db = cache["db"]
+    target = cache["maxBytes"] * 0.9
+    removed = []
+    for contentHash, version, size in db.execute("SELECT hash, version, size FROM entries ORDER BY lastUsed"):
+        if cache["totalBytes"] <= target:
+            break
+        removed.append((contentHash, version))
+        cache["totalBytes"] -= size
+
+    with db:
+        db.executemany("DELETE FROM entries WHERE hash = ? AND version = ?", removed)
@@ -0,0 +1,222 @@
+"""
+Persistent cache (SQLite) of per-document token counts for count_corpus.
+A count is reused when the file's path, size and modification time all match
+(a stat call, the file isn't even opened), or failing that when its content
+hash matches a document counted before (e.g., after a fresh checkout touched
+every mtime). Counts are kept per encoding name and markdownStrip.STRIP_VERSION,
+so changing either never reuses a stale number.
+Counts and last-used times are committed in short batches, like textCache,
+so concurrent runs don't lock each other out and an aborted run keeps its counts.
+"""
+
+import os, sqlite3, time
+
+from markdownStrip import STRIP_VERSION
+
+DEFAULT_TOKEN_CACHE_PATH = ".token_count_cache.sqlite"
+
+# Pending writes are committed in one short transaction every FLUSH_EVERY
+# rows or FLUSH_SECONDS seconds, whichever comes first
+FLUSH_EVERY = 100
+FLUSH_SECONDS = 10
+
+
+def openTokenCache(cachePath=DEFAULT_TOKEN_CACHE_PATH, encodingName="cl100k_base"):
+    """
+    Opens (or creates) the token count cache.
+
+    Parameters:
+    - cachePath (str): Location of the SQLite file.
+    - encodingName (str): Name of the tiktoken encoding the counts are for.
+
+    Returns:
+    - dict: The cache, with keys "db", "encodingName", "hits" and "misses".
+    """
+    db = sqlite3.connect(cachePath, timeout=30)
+    # Readers aren't blocked while another run commits
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS counts (
+            path TEXT NOT NULL,
+            encodingName TEXT NOT NULL,
+            stripVersion INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtimeNs INTEGER NOT NULL,
+            contentHash TEXT NOT NULL,
+            tokenCount INTEGER NOT NULL,
+            lastUsed REAL NOT NULL,
+            PRIMARY KEY (path, encodingName, stripVersion)
+        );
+        CREATE INDEX IF NOT EXISTS counts_contentHash ON counts (contentHash, encodingName, stripVersion);
+    """)
+
+    return {
+        "db": db, "encodingName": encodingName, "hits": 0, "misses": 0,
+        # Rows and last-used times waiting for the next flush, by path
+        "pending": {}, "touched": {}, "lastFlush": time.monotonic(),
+    }
+
+
+def closeTokenCache(cache):
+    """
+    Writes pending rows and closes the cache.
+    """
+    _flush(cache)
+    cache["db"].close()
+
+
+def _flush(cache):
+    """
+    Commits the pending rows and last-used times in one transaction.
+    """
+    db = cache["db"]
+    with db:
+        db.executemany(
+            "INSERT OR REPLACE INTO counts (path, encodingName, stripVersion, size, mtimeNs, contentHash, tokenCount, lastUsed) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            cache["pending"].values()
+        )
+        db.executemany(
+            "UPDATE counts SET lastUsed = ? WHERE path = ? AND encodingName = ? AND stripVersion = ?",
+            [(lastUsed, path, cache["encodingName"], STRIP_VERSION) for path, lastUsed in cache["touched"].items()]
+        )
+    cache["pending"].clear()
+    cache["touched"].clear()
+    cache["lastFlush"] = time.monotonic()
+
+
+def _maybeFlush(cache):
+    """
+    Flushes once FLUSH_EVERY writes are pending or FLUSH_SECONDS have passed since the last flush.
+    """
+    numPending = len(cache["pending"]) + len(cache["touched"])
+    if numPending >= FLUSH_EVERY or numPending and time.monotonic() - cache["lastFlush"] >= FLUSH_SECONDS:
+        _flush(cache)
+
+
+def lookupFile(cache, path):
+    """
+    Finds a cached count for a file by its path, size and mtime, without opening it.
+
+    Parameters:
+    - cache (dict): Cache from openTokenCache.
+    - path (str): Path to the .md file.
+
+    Returns:
+    - tuple or None: (token count, size, content hash), or None on a miss.
+    """
+    stat = os.stat(path)
+    if path in cache["pending"]:
+        _, _, _, size, mtimeNs, contentHash, tokenCount, _ = cache["pending"][path]
+        if (size, mtimeNs) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        cache["hits"] += 1
+        return tokenCount, size, contentHash
+
+    row = cache["db"].execute(
+        "SELECT tokenCount, size, contentHash FROM counts "
+        "WHERE path = ? AND encodingName = ? AND stripVersion = ? AND size = ? AND mtimeNs = ?",
+        (path, cache["encodingName"], STRIP_VERSION, stat.st_size, stat.st_mtime_ns)
+    ).fetchone()
+
+    if row is None:
+        return None
+
+    cache["hits"] += 1
+    _touch(cache, path)
+    return row
+
+
+def lookupContent(cache, contentHash):
+    """
+    Finds a cached count for a document by its content hash, for files whose
+    mtime changed or that were counted under another path.
+
+    Parameters:
+    - cache (dict): Cache from openTokenCache.
+    - contentHash (str): Hex SHA-256 of the file (see textCache.readSource).
+
+    Returns:
+    - int or None: The token count, or None on a miss.
+    """
+    for pendingRow in cache["pending"].values():
+        if pendingRow[5] == contentHash:
+            cache["hits"] += 1
+            return pendingRow[6]
+
+    row = cache["db"].execute(
+        "SELECT tokenCount FROM counts WHERE contentHash = ? AND encodingName = ? AND stripVersion = ? LIMIT 1",
+        (contentHash, cache["encodingName"], STRIP_VERSION)
+    ).fetchone()
+
+    if row is None:
+        cache["misses"] += 1
+        return None
+
+    cache["hits"] += 1
+    return row[0]
+
+
+def storeCount(cache, path, size, contentHash, tokenCount):
+    """
+    Records a file's token count, along with its current mtime.
+    Called for every counted file, so files that were hits by content hash
+    become hits by stat on the next run.
+
+    Parameters:
+    - cache (dict): Cache from openTokenCache.
+    - path (str): Path to the .md file.
+    - size (int): Size of the file in bytes when it was read.
+    - contentHash (str): Hex SHA-256 of the file.
+    - tokenCount (int): Number of tokens in its plaintext.
+    """
+    cache["pending"][path] = (
+        path, cache["encodingName"], STRIP_VERSION, size, os.stat(path).st_mtime_ns, contentHash, tokenCount, time.time()
+    )
+    cache["touched"].pop(path, None)
+    _maybeFlush(cache)
+
+
+def _touch(cache, path):
+    """
+    Marks a row as used now, for pruneTokenCache's unusedDays.
+    """
+    cache["touched"][path] = time.time()
+    _maybeFlush(cache)
+
+
+def pruneTokenCache(cache, missingFiles=True, oldVersions=True, unusedDays=None):
+    """
+    Deletes rows that can no longer be hit, or haven't been for a while.
+
+    Parameters:
+    - cache (dict): Cache from openTokenCache.
+    - missingFiles (bool): Drop rows for paths that no longer exist.
+    - oldVersions (bool): Drop rows for other strip versions.
+    - unusedDays (float): Drop rows not used in this many days, None to keep them.
+
+    Returns:
+    - int: Number of rows deleted.
+    """
+    _flush(cache)
+    db = cache["db"]
+    before = db.total_changes
+
+    if oldVersions:
+        db.execute("DELETE FROM counts WHERE stripVersion != ?", (STRIP_VERSION,))
+    if unusedDays is not None:
+        db.execute("DELETE FROM counts WHERE lastUsed < ?", (time.time() - unusedDays * 86400,))
+    if missingFiles:
+        missing = [(path,) for (path,) in db.execute("SELECT DISTINCT path FROM counts") if not os.path.exists(path)]
+        db.executemany("DELETE FROM counts WHERE path = ?", missing)
+
+    db.commit()
+    return db.total_changes - before
+
+
+if __name__ == '__main__':
+    cache = openTokenCache()
+    numDeleted = pruneTokenCache(cache)
+    numLeft = cache["db"].execute("SELECT COUNT(*) FROM counts").fetchone()[0]
+    closeTokenCache(cache)
+    print(f"Pruned {numDeleted:,} rows from {DEFAULT_TOKEN_CACHE_PATH}, {numLeft:,} left")
@@ -0,0 +1,140 @@
+"""
+Fast token total estimates for budgeting.
+Only file sizes are read for the whole selection. A random sample, stratified
+by file size, is counted exactly and gives a tokens-per-byte ratio for each
+size stratum, which is extrapolated over the stratum's total bytes (a
+stratified ratio estimator). The confidence interval comes from the spread of
+the sampled documents around their stratum's ratio.
+"""
+
+import math, os, random
+from statistics import NormalDist
+
+
+def stratifyBySize(sizes, numStrata=4):
+    """
+    Splits documents into size strata holding (nearly) equal numbers of documents.
+
+    Parameters:
+    - sizes (list): Size in bytes of each document.
+    - numStrata (int): Number of strata.
+
+    Returns:
+    - list: A list of document indexes for each stratum, smallest documents first.
+    """
+    bySize = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    numStrata = max(1, min(numStrata, len(sizes)))
+    bounds = [round(len(bySize) * k / numStrata) for k in range(numStrata + 1)]
+    return [bySize[bounds[k]:bounds[k + 1]] for k in range(numStrata)]
+
+
+def allocateSample(strata, sizes, sampleSize):
+    """
+    Decides how many documents to sample from each stratum: proportional to
+    the stratum's share of the bytes, since that is where the tokens are, with
+    at least two per stratum so each one has a spread estimate.
+
+    Parameters:
+    - strata (list): Strata from stratifyBySize.
+    - sizes (list): Size in bytes of each document.
+    - sampleSize (int): Total number of documents to count exactly.
+
+    Returns:
+    - list: Sample size for each stratum.
+    """
+    # A sample as big as the selection is just an exact count
+    if sampleSize >= sum(len(stratum) for stratum in strata):
+        return [len(stratum) for stratum in strata]
+
+    stratumBytes = [sum(sizes[i] for i in stratum) for stratum in strata]
+    totalBytes = sum(stratumBytes) or 1
+
+    allocation = []
+    for stratum, numBytes in zip(strata, stratumBytes):
+        share = round(sampleSize * numBytes / totalBytes)
+        allocation.append(min(len(stratum), max(2, share)))
+
+    return allocation
+
+
+def estimateFromSample(sizes, strata, sampledCounts, confidence=0.95):
+    """
+    Stratified ratio estimate of the total token count.
+
+    Parameters:
+    - sizes (list): Size in bytes of each document.
+    - strata (list): Strata from stratifyBySize.
+    - sampledCounts (dict): Exact token count for each sampled document index.
+    - confidence (float): Confidence level of the interval.
+
+    Returns:
+    - dict: "total", "low", "high", "stdError" and "bytesPerToken" (over the whole sample).
+    """
+    total = 0.0
+    variance = 0.0
+
+    for stratum in strata:
+        sampled = [i for i in stratum if i in sampledCounts]
+        if not sampled:
+            continue
+
+        sampleTokens = sum(sampledCounts[i] for i in sampled)
+        sampleBytes = sum(sizes[i] for i in sampled)
+        ratio = sampleTokens / sampleBytes if sampleBytes else 0.0
+
+        # Every document in the stratum was counted, so its total is exact
+        if len(sampled) == len(stratum):
+            total += sampleTokens
+            continue
+
+        total += ratio * sum(sizes[i] for i in stratum)
+
+        # Variance of the ratio estimator from the residuals around the ratio,
+        # with the finite population correction
+        numDocs, numSampled = len(stratum), len(sampled)
+        residualVariance = sum((sampledCounts[i] - ratio * sizes[i]) ** 2 for i in sampled) / (numSampled - 1)
+        variance += numDocs ** 2 * (1 - numSampled / numDocs) * residualVariance / numSampled
+
+    stdError = math.sqrt(variance)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    totalSampledTokens = sum(sampledCounts.values())
+
+    return {
+        "total": total,
+        "low": max(total - z * stdError, totalSampledTokens),
+        "high": total + z * stdError,
+        "stdError": stdError,
+        "bytesPerToken": sum(sizes[i] for i in sampledCounts) / totalSampledTokens if totalSampledTokens else float("nan"),
+    }
+
+
+def estimateTotalTokens(fileList, countSample, sampleSize=1000, numStrata=4, confidence=0.95, seed=None):
+    """
+    Estimates the total token count of a selection of documents.
+
+    Parameters:
+    - fileList (list): Paths of the documents.
+    - countSample (function): Takes a list of paths and returns their exact token counts, in order.
+    - sampleSize (int): Roughly how many documents to count exactly.
+    - numStrata (int): Number of file size strata.
+    - confidence (float): Confidence level of the interval.
+    - seed (int): Seed for the sample, None for a fresh one.
+
+    Returns:
+    - dict: "total", "low", "high", "stdError", "bytesPerToken" and "sampleSize".
+    """
+    if not fileList:
+        return {"total": 0, "low": 0, "high": 0, "stdError": 0.0, "bytesPerToken": float("nan"), "sampleSize": 0}
+
+    sizes = [os.path.getsize(path) for path in fileList]
+    strata = stratifyBySize(sizes, numStrata)
+    allocation = allocateSample(strata, sizes, sampleSize)
+
+    rng = random.Random(seed)
+    sampleIndexes = [i for stratum, numSampled in zip(strata, allocation) for i in rng.sample(stratum, numSampled)]
+
+    counts = countSample([fileList[i] for i in sampleIndexes])
+    estimate = estimateFromSample(sizes, strata, dict(zip(sampleIndexes, counts)), confidence)
+    estimate["sampleSize"] = len(sampleIndexes)
+
+    return estimate